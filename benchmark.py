@@ -0,0 +1,351 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from solution import Solution, DECODERS, decode, make_solutions, random_schedules, lower_bound
+from woc import aggregate, LARGE_CELLS
+from ga import ENGINES
+from instances import load_instance, fit_dtype
+import backend
+'''
+Benchmark harness for the solver.
+
+    python benchmark.py run [--out bench.json] [--files "tai20*"] ...
+    python benchmark.py compare old.json new.json [--threshold 0.1]
+    python benchmark.py scale [--sizes 50,100,200,400] [--out scale.json]
+    python benchmark.py islands [--file tai77_0.txt] [--gap 0.2] [--out islands.json]
+
+*run* goes over the Taillard instances in "./data" and records, for each one, decode throughput, GA speed,
+aggregate latency and solution quality against the instance's lower bound, as JSON.
+Decode throughput, GA speed and quality are measured for every decoder in --decoders; the top-level numbers are the first one's.
+*compare* lines up two such files and flags every metric that got worse by more than the threshold.
+*scale* times the whole pipeline (decoding, a short GA, WOC, plotting) on random n x n instances and reports each size's peak RSS.
+Sizes whose crowds are past woc.LARGE_CELLS (100 and up) are aggregated one machine at a time, which the report notes as "by_machine".
+*islands* runs the same number of isolated GAs (main.run_ga) and migrating islands (main.run_islands) on one instance,
+and compares how many evaluations each run took to reach a makespan --gap over the lower bound, and how many runs got there at all.
+'''
+
+# metric -> True if higher is better
+METRICS = {"decodes_per_s" : True,
+           "generations_per_s" : True,
+           "aggregate_ms" : False,
+           "gap" : False}
+
+def instance_files(pattern: str = "*.txt") -> list[str]:
+    """
+    Returns the names of the instance files under "./data" matching *pattern*, smallest instances first.
+    Skips .npy files, like the caches older versions of instances.py kept next to the instances.
+    """
+    names = [os.path.basename(path) for path in glob.glob(os.path.join("./data", pattern)) if not path.endswith(".npy")]
+    return sorted(names, key=lambda name: (os.path.getsize(os.path.join("./data", name)), name))
+
+def time_decodes(num_decodes: int) -> float:
+    """
+    Returns decodes per second on random schedules for Solution.data, with the decoder named by Solution.decoder.
+    """
+    schedules = random_schedules(num_decodes, Solution.data.shape)
+    decode(schedules[0])    # Leave compilation out of it, if the kernels are compiled
+    start = time.perf_counter()
+    for schedule in schedules:
+        decode(schedule)
+    return num_decodes / (time.perf_counter() - start)
+
+def time_aggregate(num_experts: int, repeats: int = 5) -> float:
+    """
+    Returns the mean latency in milliseconds of *aggregate* over *num_experts* random solutions.
+    """
+    experts = make_solutions(random_schedules(num_experts, Solution.data.shape))
+    aggregate(experts)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        aggregate(experts)
+    return 1000 * (time.perf_counter() - start) / repeats
+
+def bench_decoder(args: argparse.Namespace, bound: float) -> dict:
+    """
+    Runs the decoder-dependent measurements for Solution.data and Solution.decoder and returns their dict of results.
+    """
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+    decodes_per_s = time_decodes(args.decodes)
+
+    # Every generation's end is timestamped as it happens, so the curve shows where the time actually went
+    gen_times = []
+    start = time.perf_counter()
+    results = ENGINES[args.engine](args.pop_size, args.generations, on_generation=lambda stats: gen_times.append(time.perf_counter() - start))
+    elapsed = time.perf_counter() - start
+
+    best = float(results["best_solution"].makespan)
+    evolution = results["evolution"]
+    quality_vs_time = [(gen_time, float(ms)) for gen_time, ms in zip(gen_times, evolution)]
+
+    return {"decodes_per_s" : decodes_per_s,
+            "generations_per_s" : len(evolution) / elapsed,
+            "best_makespan" : best,
+            "gap" : best / bound - 1,
+            "quality_vs_time" : quality_vs_time}
+
+def bench_instance(name: str, args: argparse.Namespace) -> dict:
+    """
+    Runs every measurement on instance *name* and returns its dict of results.
+    """
+    Solution.data = load_instance(os.path.join("./data", name))
+    bound = lower_bound(Solution.data)
+
+    decoders = {}
+    for decoder in args.decoders:
+        Solution.decoder = decoder
+        decoders[decoder] = bench_decoder(args, bound)
+
+    Solution.decoder = args.decoders[0]
+    np.random.seed(args.seed)
+    aggregate_ms = time_aggregate(args.experts)
+
+    return {"shape" : list(Solution.data.shape),
+            "lower_bound" : float(bound),
+            "aggregate_ms" : aggregate_ms,
+            **decoders[args.decoders[0]],
+            "decoders" : decoders}
+
+def run(args: argparse.Namespace) -> None:
+    names = instance_files(args.files)
+    assert names, f"No instances in ./data match \"{args.files}\""
+
+    report = {"meta" : {"time" : time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python" : platform.python_version(),
+                        "numpy" : np.__version__,
+                        "machine" : platform.machine(),
+                        "backend" : backend.NAME,
+                        "params" : {key : value for key, value in vars(args).items() if key != "func"}},
+              "instances" : {}}
+
+    for name in names:
+        res = bench_instance(name, args)
+        report["instances"][name] = res
+        print(f"{name:<16} aggregate {res["aggregate_ms"]:>7.2f}ms")
+        for decoder, dec in res["decoders"].items():
+            print(f"  {decoder:<14} decodes/s {dec["decodes_per_s"]:>9.1f}   gens/s {dec["generations_per_s"]:>8.2f}   "
+                  f"makespan {dec["best_makespan"]:>7.0f} ({100 * dec["gap"]:.1f}% over bound)")
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=1)
+    print(f"\nWrote {args.out}")
+
+def compare(args: argparse.Namespace) -> int:
+    """
+    Prints the relative change of every metric between two *run* reports and returns the number of regressions.
+    """
+    with open(args.old) as file:
+        old = json.load(file)["instances"]
+    with open(args.new) as file:
+        new = json.load(file)["instances"]
+
+    regressions = 0
+    for name in [name for name in old if name in new]:
+        # The top-level numbers, then those of every decoder both reports measured
+        rows = [(name, old[name], new[name])]
+        old_decoders, new_decoders = old[name].get("decoders", {}), new[name].get("decoders", {})
+        rows += [(f"  {decoder}", old_decoders[decoder], new_decoders[decoder]) for decoder in old_decoders if decoder in new_decoders]
+
+        for label, before_res, after_res in rows:
+            changes = []
+            for metric, higher_better in METRICS.items():
+                if metric not in before_res or metric not in after_res:
+                    continue
+                before, after = before_res[metric], after_res[metric]
+                if metric == "gap":
+                    # Gaps can be 0, so compare makespans instead
+                    before, after = before_res["best_makespan"], after_res["best_makespan"]
+                change = (after - before) / before if before else 0.0
+                worse = -change if higher_better else change
+                flag = ""
+                if worse > args.threshold:
+                    flag = " REGRESSION"
+                    regressions += 1
+                changes.append(f"{metric} {100 * change:+.1f}%{flag}")
+            print(f"{label:<16} " + "   ".join(changes))
+
+    missing = ", ".join(sorted(set(old) ^ set(new)))
+    if missing:
+        print(f"\nOnly in one report: {missing}")
+    print(f"\n{regressions} regression(s) over {100 * args.threshold:.0f}%")
+    return regressions
+
+def scale_instance(n: int, args: argparse.Namespace) -> dict:
+    """
+    Runs the pipeline once on a random *n* x *n* instance and returns the seconds each stage took and the peak RSS in MB.
+    Meant to run in a fresh process, so the peak is this size's alone.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from solution import plot_solution
+
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+    data = np.random.randint(1, 100, size=(n, n))
+    # Same convention as instances.parse_instance: the smallest dtype holding the sum of all times
+    Solution.data = data.astype(fit_dtype(int(data.sum())))
+    Solution.decoder = "insertion"
+    res = {"size" : n, "by_machine" : n**3 > LARGE_CELLS}
+
+    start = time.perf_counter()
+    make_solutions(random_schedules(2, Solution.data.shape))   # Leave compilation out of the rest
+    res["warmup_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    experts = make_solutions(random_schedules(args.experts, Solution.data.shape))
+    res["decode_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ENGINES[args.engine](args.pop_size, args.generations)
+    res["ga_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    woc_sol = aggregate(experts)
+    res["aggregate_s"] = time.perf_counter() - start
+
+    # plot_solution saves under ./output, so do it from a scratch directory (this process is thrown away anyway)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("./output/solution_plots")
+        start = time.perf_counter()
+        plot_solution(woc_sol, title="scale", save_path="scale")
+        res["plot_s"] = time.perf_counter() - start
+
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    res["peak_rss_mb"] = peak / (2**20 if sys.platform == "darwin" else 2**10)
+    return res
+
+def scale(args: argparse.Namespace) -> None:
+    report = {"meta" : {"time" : time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python" : platform.python_version(),
+                        "backend" : backend.NAME,
+                        "params" : {key : value for key, value in vars(args).items() if key != "func"}},
+              "sizes" : []}
+
+    stages = ("decode_s", "ga_s", "aggregate_s", "plot_s")
+    print(f"{'size':>6} " + " ".join(f"{stage:>12}" for stage in stages) + f" {'peak RSS':>10}")
+    for n in args.sizes:
+        # A fresh process per size, so peak RSS doesn't carry over from the last one
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            res = executor.submit(scale_instance, n, args).result()
+        report["sizes"].append(res)
+        print(f"{n:>6} " + " ".join(f"{res[stage]:>11.3f}s" for stage in stages) + f" {res['peak_rss_mb']:>8.0f}MB")
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=1)
+    print(f"\nWrote {args.out}")
+
+def evals_to_target(results: list[dict]) -> dict:
+    """
+    Sums up the "evals_to_target" of the *results* of several repeats of *run_ga* or *run_islands*:
+    the share of runs that got there ("hit_rate"), the mean evaluations of those that did ("mean_evals"),
+    the mean over repeats of the quickest run ("first_evals", what a group of runs spends per run until one of them gets there)
+    and the mean best makespan ("avg_ms").
+    """
+    evals = [[count for count in res["evals_to_target"] if count is not None] for res in results]
+    hits = [count for repeat in evals for count in repeat]
+    return {"hit_rate" : len(hits) / sum(len(res["evals_to_target"]) for res in results),
+            "mean_evals" : float(np.mean(hits)) if hits else None,
+            "first_evals" : float(np.mean([min(repeat) for repeat in evals if repeat])) if hits else None,
+            "avg_ms" : float(np.mean([res["avg_ms"] for res in results]))}
+
+def islands(args: argparse.Namespace) -> None:
+    # main pulls in the plotting and table libraries, which the other commands don't need
+    from main import run_ga, run_islands
+
+    data = load_instance(os.path.join("./data", args.file))
+    target = float(np.floor(lower_bound(data) * (1 + args.gap)))
+    ga_params = (args.pop_size, args.generations)
+    np.random.seed(args.seed)
+
+    isolated, migrating = [], []
+    for _ in range(args.repeats):
+        isolated.append(run_ga(args.runs, ga_params, data, stop={"target" : target}))
+        migrating.append(run_islands(args.runs, ga_params, data, interval=args.interval, migrants=args.migrants,
+                                     topology=args.topology, target=target))
+
+    report = {"meta" : {"time" : time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python" : platform.python_version(),
+                        "backend" : backend.NAME,
+                        "params" : {key : value for key, value in vars(args).items() if key != "func"}},
+              "target" : target,
+              "isolated" : evals_to_target(isolated),
+              "islands" : evals_to_target(migrating)}
+
+    print(f"\n{args.file}: target makespan {target:.0f}, {args.repeats} x {args.runs} runs of {args.pop_size} x {args.generations}")
+    print(f"{'':>9} {'hit rate':>9} {'mean evals':>11} {'first evals':>12} {'avg ms':>8}")
+    for mode in ("isolated", "islands"):
+        res = report[mode]
+        mean_evals = f"{res['mean_evals']:>11.0f}" if res["mean_evals"] is not None else f"{'-':>11}"
+        first_evals = f"{res['first_evals']:>12.0f}" if res["first_evals"] is not None else f"{'-':>12}"
+        print(f"{mode:>9} {100 * res['hit_rate']:>8.0f}% {mean_evals} {first_evals} {res['avg_ms']:>8.1f}")
+
+    with open(args.out, 'w') as file:
+        json.dump(report, file, indent=1)
+    print(f"\nWrote {args.out}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the solver on the bundled Taillard instances.")
+    subparsers = parser.add_subparsers(required=True)
+
+    run_parser = subparsers.add_parser("run", help="benchmark instances and write a JSON report")
+    run_parser.add_argument("--files", default="*.txt", help="glob of instance files under ./data (default: all)")
+    run_parser.add_argument("--out", default="bench.json", help="report path")
+    run_parser.add_argument("--engine", default="list", choices=list(ENGINES))
+    run_parser.add_argument("--pop-size", type=int, default=50)
+    run_parser.add_argument("--generations", type=int, default=20)
+    run_parser.add_argument("--decodes", type=int, default=50, help="decodes to time")
+    run_parser.add_argument("--decoders", type=lambda names: names.split(","), default=list(DECODERS),
+                            help="comma-separated decoders to measure, the first one gives the top-level numbers (default: all)")
+    run_parser.add_argument("--experts", type=int, default=24, help="solutions to aggregate")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two reports and flag regressions")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    compare_parser.set_defaults(func=compare)
+
+    scale_parser = subparsers.add_parser("scale", help="time and peak memory of the pipeline on growing random instances")
+    scale_parser.add_argument("--sizes", type=lambda sizes: [int(n) for n in sizes.split(",")], default=[50, 100, 200, 400],
+                              help="comma-separated numbers of machines (= jobs)")
+    scale_parser.add_argument("--out", default="scale.json", help="report path")
+    scale_parser.add_argument("--engine", default="list", choices=list(ENGINES))
+    scale_parser.add_argument("--pop-size", type=int, default=20)
+    scale_parser.add_argument("--generations", type=int, default=5)
+    scale_parser.add_argument("--experts", type=int, default=24, help="random solutions to decode and aggregate")
+    scale_parser.add_argument("--seed", type=int, default=0)
+    scale_parser.set_defaults(func=scale)
+
+    islands_parser = subparsers.add_parser("islands", help="evaluations to a target makespan, isolated GAs vs islands")
+    islands_parser.add_argument("--file", default="tai77_0.txt", help="instance under ./data")
+    islands_parser.add_argument("--gap", type=float, default=0.2, help="target makespan, relative to the lower bound")
+    islands_parser.add_argument("--out", default="islands.json", help="report path")
+    islands_parser.add_argument("--runs", type=int, default=4, help="GAs (or islands) per repeat")
+    islands_parser.add_argument("--repeats", type=int, default=5)
+    islands_parser.add_argument("--pop-size", type=int, default=50)
+    islands_parser.add_argument("--generations", type=int, default=100)
+    islands_parser.add_argument("--interval", type=int, default=10, help="generations between migrations")
+    islands_parser.add_argument("--migrants", type=int, default=2)
+    islands_parser.add_argument("--topology", default="ring", choices=["ring", "random"])
+    islands_parser.add_argument("--seed", type=int, default=0)
+    islands_parser.set_defaults(func=islands)
+
+    args = parser.parse_args()
+    res = args.func(args)
+    return 1 if res else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import numpy as np
+from progress import RunningStats
+'''
+On-disk checkpoints for long experiments, so a crashed or preempted sweep can pick up where it left off.
+
+Everything goes under "./checkpoints" (never under "./output", which *reset_output* wipes), in one directory per experiment
+configuration. Files are plain .npz archives, always written to a temporary file first and renamed into place,
+so a crash mid-write never leaves a broken checkpoint behind.
+'''
+
+CHECKPOINT_DIR = "./checkpoints"
+
+def atomic_savez(path: str, **arrays) -> None:
+    """
+    Saves *arrays* as an uncompressed .npz archive at *path*, replacing whatever was there in one step.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmp, path)
+
+def experiment_dir(**config) -> str:
+    """
+    Returns (and creates) the checkpoint directory of the experiment described by *config*,
+    which must hold everything that changes its results (parameters, instances, ...), as reprs that are stable between runs.
+    """
+    key = hashlib.blake2b(repr(sorted(config.items())).encode(), digest_size=8).hexdigest()
+    path = os.path.join(CHECKPOINT_DIR, key)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class GACheckpoint:
+    """
+    Where a single GA run saves its population every few generations, and picks it back up from after a restart.
+
+    Attributes:
+        path (str):     the run's .npz file
+        every (int):    generations between saves
+
+    """
+
+    def __init__(self, path: str, every: int = 5):
+        self.path = path
+        self.every = every
+
+    def due(self, gen: int) -> bool:
+        """
+        Whether to save after generation *gen* (0-based) is done.
+        """
+        return (gen + 1) % self.every == 0
+
+    def save(self, schedules: np.ndarray, evolution: list[float], elapsed: float, stop_reason: str = "") -> None:
+        """
+        Saves the run's (P, M, N) population *schedules*, its *evolution* so far and the CPU time it has *elapsed*.
+        Runs that are over pass their *stop_reason*, and are only read back, never continued.
+        """
+        atomic_savez(self.path, schedules=schedules, evolution=np.asarray(evolution, dtype=float),
+                     elapsed=elapsed, stop_reason=stop_reason)
+
+    def load(self) -> dict:
+        """
+        Returns the last saved state (keys as in *save*, stop_reason "" if the run wasn't over), or None if there isn't one.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path) as saved:
+            return {"schedules" : saved["schedules"],
+                    "evolution" : saved["evolution"].tolist(),
+                    "elapsed" : float(saved["elapsed"]),
+                    "stop_reason" : str(saved["stop_reason"])}
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Arrays of a finished iteration's *workers.ga_unit*, besides its evolution stats
+UNIT_ARRAYS = ("schedules", "starts", "makespans", "times")
+
+def save_unit(path: str, unit: dict, ga_results: list[dict], woc_schedule: np.ndarray, ensemble_stats: list[dict] = None) -> None:
+    """
+    Saves a finished (size, iteration) unit: the *unit* its GAs' results were taken into (see workers.ga_unit),
+    the leftover dicts *ga_results* they returned, its WOC aggregate *woc_schedule* and, if it came from an ensemble, its *ensemble_stats*.
+    """
+    count, mean, m2 = unit["evolution_stats"].state()
+    arrays = {key : unit[key] for key in UNIT_ARRAYS}
+    atomic_savez(path, **arrays, evolution_count=count, evolution_mean=mean, evolution_m2=m2,
+                 ga_results=json.dumps(ga_results, default=lambda value: value.item()), woc_schedule=woc_schedule,
+                 ensemble_stats=json.dumps(ensemble_stats))
+
+def load_unit(path: str) -> tuple[dict, list[dict], np.ndarray, list[dict]]:
+    """
+    Returns the (unit, ga_results, woc_schedule, ensemble_stats) saved by *save_unit*.
+    """
+    with np.load(path) as saved:
+        unit = {key : saved[key] for key in UNIT_ARRAYS}
+        unit["evolution_stats"] = RunningStats.from_state(saved["evolution_count"], saved["evolution_mean"], saved["evolution_m2"])
+        return unit, json.loads(str(saved["ga_results"])), saved["woc_schedule"], json.loads(str(saved["ensemble_stats"]))
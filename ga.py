@@ -1,35 +1,41 @@
+import sys
 import random
 import numpy as np
 import time
-import matplotlib.pyplot as plt
-from solution import Solution
+from collections.abc import Callable, Iterable
+from instrument import metrics
+import backend
+from solution import Solution, random_schedules, decode_batch, make_solutions, lower_bound
+from local_search import LocalSearch
+from checkpoint import GACheckpoint
 
-def mutate(sol: Solution) -> Solution:
+def mutate(sol: Solution, rate: float = None) -> Solution:
     """
-    Returns mutated version of *sol*.
+    Returns mutated version of *sol*, with probability *rate* (Solution.mutate_rate if not given).
     """
-    if random.random() < Solution.mutate_rate:
+    if random.random() < (Solution.mutate_rate if rate is None else rate):
         machine = random.randint(0, sol.schedule.shape[0] - 1)
         job1, job2 = random.sample(range(sol.schedule.shape[1]), 2)
-        new_schedule = np.copy(sol.schedule)
-        new_schedule[machine, job1], new_schedule[machine, job2] = sol.schedule[machine, job2], sol.schedule[machine, job1]
-        res = Solution(new_schedule)
+        res = sol.swap(machine, job1, job2)
+        metrics.count("mutations")
     else:
         res = sol
 
     return res
 
-def crossover(s1: Solution, s2: Solution) -> tuple[Solution, Solution]:
+@metrics.timed("crossover")
+def crossover(s1: Solution, s2: Solution, rate: float = None) -> tuple[Solution, Solution]:
     """
-    Returns offspring pair of *s1* and *s2*.
+    Returns offspring pair of *s1* and *s2*, crossed over with probability *rate* (Solution.cross_rate if not given).
     """
     
     # Want unique objects
     if id(s1) == id(s2):
         s2 = Solution(s2.schedule)
 
-    if random.random() >= Solution.cross_rate:
+    if random.random() >= (Solution.cross_rate if rate is None else rate):
         return s1, s2
+    metrics.count("crossovers")
     
     num_machines, num_jobs = s1.schedule.shape
     new_schedule1 = np.empty_like(s1.schedule)
@@ -50,7 +56,11 @@ def crossover(s1: Solution, s2: Solution) -> tuple[Solution, Solution]:
     c1, c2 = Solution(new_schedule1), Solution(new_schedule2)
     return sorted([c1, c2, s1, s2], key=lambda x: x.makespan)[:2]
     
+@metrics.timed("fill_from_parent")
 def fill_from_parent(child_row, parent_row, start, end):
+    if backend.ENABLED:
+        backend.fill_from_parent(child_row, parent_row, start, end)
+        return
    
     pos = end  # Start filling after the crossover slice
     for job in parent_row:
@@ -60,55 +70,362 @@ def fill_from_parent(child_row, parent_row, start, end):
             child_row[pos] = job
             pos += 1
 
-def genetic_algorithm(population_size: int, generations: int) -> dict:
+class Termination:
+    """
+    Early stopping rules for a GA run. Every rule is off unless given.
+
+    Attributes:
+        target (float):             stop once the best makespan is at most this
+        stop_at_bound (bool):       stop once the best makespan reaches *lower_bound* of Solution.data (it can't get any better)
+        patience (int):             stop after this many generations in a row without improvement
+        time_limit (float):         stop after this many seconds of wall-clock time
+        max_evals (int):            stop after this many Solution.evaluations since creation
+        should_stop (callable):     polled every generation, stop when it returns True (e.g. a sibling run found the optimum)
+
+        evals_to_target (int):      Solution.evaluations spent since creation when *target* was first reached, None until then
+
+    """
+
+    def __init__(self, target: float = None, stop_at_bound: bool = False, patience: int = None, time_limit: float = None,
+                 max_evals: int = None, should_stop: Callable[[], bool] = None):
+        self.target = target
+        self.bound = lower_bound(Solution.data) if stop_at_bound else None
+        self.patience = patience
+        self.time_limit = time_limit
+        self.max_evals = max_evals
+        self.should_stop = should_stop
+
+        self.start = time.perf_counter()
+        self.start_evals = Solution.evaluations
+        self.evals_to_target = None
+        self.best = float('inf')
+        self.stale = 0
+
+    def check(self, best: float) -> str:
+        """
+        Takes the best makespan of the generation just evaluated and returns why the run should stop, or None to carry on.
+        """
+        if best < self.best:
+            self.best = best
+            self.stale = 0
+        else:
+            self.stale += 1
+
+        if self.target is not None and self.evals_to_target is None and best <= self.target:
+            self.evals_to_target = Solution.evaluations - self.start_evals
+        if self.bound is not None and best <= self.bound:
+            return "lower_bound"
+        if self.target is not None and best <= self.target:
+            return "target"
+        if self.patience is not None and self.stale >= self.patience:
+            return "stagnation"
+        if self.time_limit is not None and time.perf_counter() - self.start >= self.time_limit:
+            return "time_limit"
+        if self.max_evals is not None and Solution.evaluations - self.start_evals >= self.max_evals:
+            return "evaluations"
+        if self.should_stop is not None and self.should_stop():
+            return "cancelled"
+        return None
+
+def genetic_algorithm(population_size: int, generations: int, migrate: Callable[[int, list[Solution]], list[Solution]] = None,
+                      termination: Termination = None, local_search: LocalSearch = None, checkpoint: GACheckpoint = None,
+                      cross_rate: float = None, mutate_rate: float = None, on_generation: Callable[[dict], None] = None) -> dict:
     """
     Runs ga with given parameters and returns dictionary of results.
+
+    If *migrate* is given, it is called as migrate(gen, population) after every generation and returns the population to carry on with
+    (used by the island model to swap individuals with other runs).
+
+    If *termination* is given, the run may stop before *generations*. The results say why under "stop_reason"
+    ("generations" if it ran to the end) and how many generations it ran under "generations".
+    If it has a target, "evals_to_target" says how many evaluations it took to reach it (None if it never did).
+
+    If *local_search* is given, it improves the best few solutions of every generation before they breed (see local_search.py),
+    and its stats are returned under "local_search".
+
+    Schedules decoded over the whole run are counted under "evaluations".
+
+    If *checkpoint* is given, the population is saved to it every few generations and once more at the end,
+    and a run that finds a saved population there carries on from it (see *resume*) instead of starting over.
+
+    *cross_rate* and *mutate_rate* override Solution's class rates for this run only.
+
+    If *on_generation* is given, it is called with the *generation_stats* of every generation as soon as it's evaluated.
     """
     start = time.process_time()
+    start_evals = Solution.evaluations
     
-    population = [Solution() for _ in range(population_size)]
-    evolution = []
+    saved = resume(checkpoint)
+    if saved is None:
+        population = make_solutions(random_schedules(population_size, Solution.data.shape))
+        evolution, first_gen, stop_reason = [], 0, "generations"
+    else:
+        population = make_solutions(saved["schedules"])
+        evolution, first_gen, stop_reason = saved["evolution"], saved["first_gen"], saved["stop_reason"]
+        start -= saved["elapsed"]
     
-    for gen in range(generations):
-        population.sort(key=lambda x: x.makespan)
+    for gen in range(first_gen, generations):
+        with metrics.phase("sort"):
+            population.sort(key=lambda x: x.makespan)
+        if local_search is not None:
+            with metrics.phase("local_search"):
+                num_elites = local_search.num_elites
+                population[:num_elites] = [local_search.improve(sol) for sol in population[:num_elites]]
+                population.sort(key=lambda x: x.makespan)
         evolution.append(population[0].makespan)
-        
-        next_gen = population[:population_size // 10]
-
-        while len(next_gen) < population_size:
-            parent1, parent2 = random.sample(next_gen, 2)
-            offspring1, offspring2 = crossover(parent1, parent2)
-            offspring1 = mutate(offspring1)
-            offspring2 = mutate(offspring2)
-            next_gen.append(offspring1)
-            if len(next_gen) < population_size:
-                next_gen.append(offspring2)
+        if on_generation is not None:
+            on_generation(generation_stats(gen, [sol.makespan for sol in population], start, start_evals))
+        if termination is not None:
+            reason = termination.check(population[0].makespan)
+            if reason is not None:
+                stop_reason = reason
+                break
 
-        population = next_gen
+        population = next_generation(population, population_size, cross_rate, mutate_rate)
+        if migrate is not None:
+            population = migrate(gen, population)
+        if checkpoint is not None and checkpoint.due(gen):
+            checkpoint.save(np.stack([sol.schedule for sol in population]), evolution, time.process_time() - start)
 
     best_solution = min(population, key=lambda x: x.makespan)
     end = time.process_time()
+    if checkpoint is not None:
+        checkpoint.save(np.stack([sol.schedule for sol in population]), evolution, end - start, stop_reason)
     results = {"best_solution" : best_solution,
                "evolution" : evolution,
-               "time" : end - start,}
+               "time" : end - start,
+               "stop_reason" : stop_reason,
+               "generations" : len(evolution),
+               "evaluations" : Solution.evaluations - start_evals,}
+    if termination is not None and termination.target is not None:
+        results["evals_to_target"] = termination.evals_to_target
+    if local_search is not None:
+        results["local_search"] = local_search.stats()
+    if Solution.cache is not None:
+        results["cache_stats"] = Solution.cache.stats()
+    if metrics.enabled:
+        results["metrics"] = metrics.snapshot()
     return results
 
+def generation_stats(gen: int, makespans: Iterable[float], start: float, start_evals: int) -> dict:
+    """
+    Returns what *on_generation* callbacks get about generation *gen*: its "generation", the "best" and "mean" of the population's *makespans*,
+    the CPU time "elapsed" since *start* and the "evaluations" since *start_evals* (both as the results dict counts them).
+    """
+    makespans = np.asarray(makespans)
+    return {"generation" : gen,
+            "best" : float(makespans.min()),
+            "mean" : float(makespans.mean()),
+            "elapsed" : time.process_time() - start,
+            "evaluations" : Solution.evaluations - start_evals}
+
+def resume(checkpoint: GACheckpoint) -> dict:
+    """
+    Returns what a GA run needs to carry on from *checkpoint*'s saved state, or None if there is none (or no *checkpoint*):
+    its "schedules", "evolution", "elapsed" CPU time, "first_gen" to run and "stop_reason".
+    Runs that stopped early start past any generation count, so they only rebuild their results.
+    Runs that used up their generations carry on if given more of them.
+    """
+    saved = checkpoint.load() if checkpoint is not None else None
+    if saved is None:
+        return None
+    saved["first_gen"] = len(saved["evolution"]) if saved["stop_reason"] in ("", "generations") else sys.maxsize
+    saved["stop_reason"] = saved["stop_reason"] or "generations"
+    return saved
+
+def next_generation(population: list[Solution], population_size: int, cross_rate: float = None, mutate_rate: float = None) -> list[Solution]:
+    """
+    Breeds the next generation from *population*, which must be sorted by makespan. Its best tenth survives as is.
+    Rates not given are Solution's.
+    """
+    next_gen = population[:population_size // 10]
+
+    while len(next_gen) < population_size:
+        parent1, parent2 = random.sample(next_gen, 2)
+        offspring1, offspring2 = crossover(parent1, parent2, cross_rate)
+        offspring1 = mutate(offspring1, mutate_rate)
+        offspring2 = mutate(offspring2, mutate_rate)
+        next_gen.append(offspring1)
+        if len(next_gen) < population_size:
+            next_gen.append(offspring2)
+
+    return next_gen
+
+def order_crossover_batch(parents1: np.ndarray, parents2: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batched version of the slice-and-fill step in *crossover*, applied to every pair of the (K, M, N) stacks *parents1*, *parents2*.
+
+    Every machine of every pair gets its own random slice. Returns the two (K, M, N) stacks of children.
+    """
+    num_jobs = parents1.shape[-1]
+    rows1 = parents1.reshape(-1, num_jobs)
+    rows2 = parents2.reshape(-1, num_jobs)
+
+    # Same as sorted(random.sample(range(num_jobs), 2)) for every row
+    first = np.random.randint(num_jobs, size=len(rows1))
+    second = (first + np.random.randint(1, num_jobs, size=len(rows1))) % num_jobs
+    start, end = np.minimum(first, second), np.maximum(first, second)
+
+    children1 = fill_rows(rows1, rows2, start, end)
+    children2 = fill_rows(rows2, rows1, start, end)
+    return children1.reshape(parents1.shape), children2.reshape(parents2.shape)
+
+def fill_rows(keep: np.ndarray, fill: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    Batched *fill_from_parent*: each row keeps *keep*[start:end] and takes the remaining jobs in *fill*'s order,
+    placed from *end* onward and wrapping around.
+    """
+    num_rows, num_jobs = keep.shape
+    rows = np.arange(num_rows)[:, None]
+    cols = np.arange(num_jobs)[None, :]
+
+    kept_pos = (cols >= start[:, None]) & (cols < end[:, None])
+    kept_job = np.empty_like(kept_pos)
+    kept_job[rows, keep] = kept_pos
+
+    # Jobs of *fill* that aren't kept, in order, come first
+    fill_jobs = fill[rows, np.argsort(kept_job[rows, fill], axis=1, kind="stable")]
+
+    # Walking positions end, end+1, ... (mod num_jobs) visits the free positions first, then the kept slice
+    pos = (end[:, None] + cols) % num_jobs
+    num_free = (num_jobs - (end - start))[:, None]
+    child = np.empty_like(keep)
+    child[rows, pos] = np.where(cols < num_free, fill_jobs, keep[rows, pos])
+    return child
+
+def swap_mutation_batch(schedules: np.ndarray) -> np.ndarray:
+    """
+    Batched swap step of *mutate*: returns a copy of the (K, M, N) stack *schedules* with two jobs swapped on one random machine of each schedule.
+    """
+    count, num_machines, num_jobs = schedules.shape
+    inds = np.arange(count)
+    machine = np.random.randint(num_machines, size=count)
+    job1 = np.random.randint(num_jobs, size=count)
+    job2 = (job1 + np.random.randint(1, num_jobs, size=count)) % num_jobs
+
+    res = np.copy(schedules)
+    res[inds, machine, job1] = schedules[inds, machine, job2]
+    res[inds, machine, job2] = schedules[inds, machine, job1]
+    return res
+
+def genetic_algorithm_tensor(population_size: int, generations: int, termination: Termination = None, checkpoint: GACheckpoint = None,
+                             cross_rate: float = None, mutate_rate: float = None, on_generation: Callable[[dict], None] = None) -> dict:
+    """
+    Tensor-backed alternative to *genetic_algorithm*, returning the same dictionary of results.
+
+    The population is one (P, M, N) array of schedules plus a makespan vector. Elites are picked with argpartition,
+    and each generation's crossovers and mutations are done as batched array operations, each decoded with one *decode_batch* call.
+    Unlike *genetic_algorithm*, parents are always drawn from the elites, never from offspring of the same generation.
+
+    *termination*, *checkpoint*, the rates and *on_generation* work the same as in *genetic_algorithm*. There is no local search stage.
+    """
+    start = time.process_time()
+    start_evals = Solution.evaluations
+    cross_rate = Solution.cross_rate if cross_rate is None else cross_rate
+    mutate_rate = Solution.mutate_rate if mutate_rate is None else mutate_rate
+
+    num_elites = population_size // 10
+    num_pairs = (population_size - num_elites + 1) // 2
+    saved = resume(checkpoint)
+    if saved is None:
+        population = random_schedules(population_size, Solution.data.shape)
+        evolution, first_gen, stop_reason = [], 0, "generations"
+    else:
+        population = saved["schedules"]
+        evolution, first_gen, stop_reason = saved["evolution"], saved["first_gen"], saved["stop_reason"]
+        start -= saved["elapsed"]
+    _, makespans = decode_batch(population)
+
+    for gen in range(first_gen, generations):
+        evolution.append(makespans.min())
+        if on_generation is not None:
+            on_generation(generation_stats(gen, makespans, start, start_evals))
+        if termination is not None:
+            reason = termination.check(evolution[-1])
+            if reason is not None:
+                stop_reason = reason
+                break
+
+        with metrics.phase("sort"):
+            elites = np.argpartition(makespans, num_elites - 1)[:num_elites]
+            elite_scheds, elite_ms = population[elites], makespans[elites]
+
+        # Two distinct elites per pair, like random.sample(next_gen, 2)
+        first = np.random.randint(num_elites, size=num_pairs)
+        second = (first + np.random.randint(1, num_elites, size=num_pairs)) % num_elites
+        family = np.stack((elite_scheds[first], elite_scheds[second], elite_scheds[first], elite_scheds[second]), axis=1)
+        family_ms = np.stack((elite_ms[first], elite_ms[second], elite_ms[first], elite_ms[second]), axis=1)
+
+        # Children of crossing pairs go in slots 0 and 1, then the best two of children and parents survive
+        best_two = np.tile([0, 1], (num_pairs, 1))
+        crossing = np.flatnonzero(np.random.random(num_pairs) < cross_rate)
+        if len(crossing):
+            metrics.count("crossovers", len(crossing))
+            with metrics.phase("crossover"):
+                children1, children2 = order_crossover_batch(family[crossing, 0], family[crossing, 1])
+            _, children_ms = decode_batch(np.concatenate((children1, children2)))
+            family[crossing, 0], family[crossing, 1] = children1, children2
+            family_ms[crossing, 0], family_ms[crossing, 1] = np.split(children_ms, 2)
+            best_two[crossing] = np.argsort(family_ms[crossing], axis=1, kind="stable")[:, :2]
+
+        pair_inds = np.arange(num_pairs)[:, None]
+        offspring = family[pair_inds, best_two].reshape(-1, *population.shape[1:])
+        offspring_ms = family_ms[pair_inds, best_two].reshape(-1)
+
+        mutating = np.flatnonzero(np.random.random(len(offspring)) < mutate_rate)
+        if len(mutating):
+            metrics.count("mutations", len(mutating))
+            offspring[mutating] = swap_mutation_batch(offspring[mutating])
+            _, offspring_ms[mutating] = decode_batch(offspring[mutating])
+
+        num_offspring = population_size - num_elites
+        population = np.concatenate((elite_scheds, offspring[:num_offspring]))
+        makespans = np.concatenate((elite_ms, offspring_ms[:num_offspring]))
+        if checkpoint is not None and checkpoint.due(gen):
+            checkpoint.save(population, evolution, time.process_time() - start)
+
+    best_solution = Solution(population[np.argmin(makespans)])
+    end = time.process_time()
+    if checkpoint is not None:
+        checkpoint.save(population, evolution, end - start, stop_reason)
+    results = {"best_solution" : best_solution,
+               "evolution" : evolution,
+               "time" : end - start,
+               "stop_reason" : stop_reason,
+               "generations" : len(evolution),
+               "evaluations" : Solution.evaluations - start_evals,}
+    if termination is not None and termination.target is not None:
+        results["evals_to_target"] = termination.evals_to_target
+    if Solution.cache is not None:
+        results["cache_stats"] = Solution.cache.stats()
+    if metrics.enabled:
+        results["metrics"] = metrics.snapshot()
+    return results
+
+# Selectable GA implementations, all taking (population_size, generations, termination=None, checkpoint=None, cross_rate=None, mutate_rate=None,
+# on_generation=None) and returning the same results dict
+ENGINES = {"list" : genetic_algorithm,
+           "tensor" : genetic_algorithm_tensor}
+
 
+@metrics.timed("plot")
 def plot_gens(gens: list[float], title: str = None, save_path : str = None) -> None:
     """
     Takes list of makespan per generation and plots its evolution.
 
     If *save_path* is given as a nonempty string, saves plot at "./output/ga_evolution/" under *save_path*.png
     """
+    import matplotlib.pyplot as plt     # Only plots need it
 
-    plt.plot(range(1, len(gens)+1), gens)
+    fig, ax = plt.subplots()
+    ax.plot(range(1, len(gens)+1), gens)
 
-    plt.title("Genetic Algorithm Evolution" + f" ({title})" if title else "")
-    plt.xlabel("Generation #")
-    plt.ylabel("Makespan")
+    ax.set_title("Genetic Algorithm Evolution" + f" ({title})" if title else "")
+    ax.set_xlabel("Generation #")
+    ax.set_ylabel("Makespan")
     if save_path:
         path = f"./output/ga_evolution/{save_path}.png"
-        plt.savefig(path, bbox_inches="tight")
-        plt.close()
+        fig.savefig(path, bbox_inches="tight")
+        plt.close(fig)
     else:
         plt.show()
\ No newline at end of file
@@ -0,0 +1,76 @@
+import os
+import glob
+import numpy as np
+'''
+Loading of Taillard-format instance files.
+
+Parsed instances are cached as .npy files in a ".cache" directory next to their source file, and later loads memory-map the cache
+instead of parsing the text again. A cache is rebuilt whenever its source file is newer than it.
+The caches stay out of the instance directory itself, so globbing it (e.g. "tai20*") only finds instances.
+'''
+
+def fit_dtype(max_value: int) -> np.dtype:
+    """
+    Returns the smallest signed integer dtype that holds every value in [0, *max_value*].
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def parse_instance(path: str) -> np.ndarray:
+    """
+    Parses the instance file at *path* into an array where data[i, j] is the time-length of the jth job on the ith machine.
+
+    The dtype is picked so the sum of all times fits, so no schedule built on it can overflow.
+    """
+    with open(path, 'r') as file:
+        file.readline()
+        num_jobs, num_machines = (int(x) for x in file.readline().split()[:2])
+
+        file.readline()
+        times = np.array([file.readline().split() for _ in range(num_jobs)], dtype=np.int64)
+
+        # times[j, k] is job j's kth operation, which runs on machine machines[j, k] (1-based)
+        file.readline()
+        machines = np.array([file.readline().split() for _ in range(num_jobs)], dtype=fit_dtype(num_machines)) - 1
+
+    data = np.empty((num_jobs, num_machines), dtype=fit_dtype(int(times.sum())))
+    data[np.arange(num_jobs)[:, None], machines] = times
+    return np.ascontiguousarray(data.T)
+
+def cache_path(path: str) -> str:
+    """
+    Returns where the parsed cache of the instance file at *path* lives.
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, ".cache", os.path.splitext(name)[0] + ".npy")
+
+def load_instance(path: str, mmap: bool = True) -> np.ndarray:
+    """
+    Returns the instance at *path*, from its .npy cache if that is up to date, otherwise parsing it and (re)writing the cache.
+
+    With *mmap*, the cached array is memory-mapped read-only instead of read into memory.
+    """
+    cache = cache_path(path)
+    if not os.path.exists(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+        data = parse_instance(path)
+        try:
+            # Write then rename, so a concurrent loader never sees half a file
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            tmp = f"{cache}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as file:
+                np.save(file, data)
+            os.replace(tmp, cache)
+        except OSError:
+            pass    # Read-only data directory, just don't cache
+        return data
+
+    return np.asarray(np.load(cache, mmap_mode='r' if mmap else None))
+
+def load_instances(directory: str = "./data", pattern: str = "*.txt", mmap: bool = True) -> dict[str, np.ndarray]:
+    """
+    Loads every instance file in *directory* matching *pattern*. Returns file name -> data, in sorted name order.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    return {os.path.basename(path) : load_instance(path, mmap) for path in paths}
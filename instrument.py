@@ -0,0 +1,159 @@
+import os
+import time
+import signal
+import functools
+import contextlib
+from collections import Counter
+'''
+Low-overhead instrumentation: per-phase timers, event counters and an optional sampling profiler.
+
+Code reports into the process-wide *metrics* object:
+
+    with metrics.phase("sort"):
+        ...
+    metrics.count("decodes")
+
+or decorates a function with *metrics.timed("make_starts")*.
+
+Both are no-ops until *metrics.enable()* is called, so leaving them in hot paths costs next to nothing.
+'''
+
+# Shared do-nothing context manager handed out while disabled
+_NULL_PHASE = contextlib.nullcontext()
+
+class _Phase:
+    """
+    Context manager timing one entry into a phase.
+    """
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.timers[self.name] += time.perf_counter() - self.start
+        self.metrics.calls[self.name] += 1
+
+class Metrics:
+    """
+    Timers and counters of one process.
+
+    Attributes:
+        enabled (bool):     whether anything is being recorded
+        timers (Counter):   phase -> total seconds spent in it (nested phases are counted in both)
+        calls (Counter):    phase -> times it was entered
+        counters (Counter): event -> count (decodes, crossovers, mutations, cache hits, ...)
+        samples (Counter):  "file:function" -> profiler samples landing in it, if sampling is on
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_interval = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.timers = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        self.samples = Counter()
+
+    def enable(self, sample_interval: float = None) -> None:
+        """
+        Clears everything and starts recording. If *sample_interval* (seconds of CPU time) is given,
+        also samples the running function that often (Unix main thread only).
+        """
+        self.stop_sampling()
+        self.reset()
+        self.enabled = True
+        if sample_interval and hasattr(signal, "setitimer"):
+            self.sample_interval = sample_interval
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, sample_interval, sample_interval)
+
+    def disable(self) -> None:
+        """
+        Stops recording. What was recorded is kept until the next *enable* or *reset*.
+        """
+        self.stop_sampling()
+        self.enabled = False
+
+    def stop_sampling(self) -> None:
+        if self.sample_interval is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            self.sample_interval = None
+
+    def _sample(self, signum: int, frame) -> None:
+        if frame is not None:
+            code = frame.f_code
+            self.samples[f"{os.path.basename(code.co_filename)}:{code.co_name}"] += 1
+
+    def phase(self, name: str):
+        """
+        Returns a context manager that adds the time spent inside it to phase *name*.
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def timed(self, name: str):
+        """
+        Decorator that times every call of the decorated function as phase *name*.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Phase(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Adds *n* to counter *name*.
+        """
+        if self.enabled:
+            self.counters[name] += n
+
+    def snapshot(self) -> dict:
+        """
+        Returns a plain, picklable copy of everything recorded so far.
+        """
+        return {"timers" : dict(self.timers),
+                "calls" : dict(self.calls),
+                "counters" : dict(self.counters),
+                "samples" : dict(self.samples)}
+
+    @staticmethod
+    def merge(snapshots: list[dict]) -> dict:
+        """
+        Sums several *snapshot* dictionaries (e.g. from different worker processes) into one.
+        """
+        merged = {"timers" : Counter(), "calls" : Counter(), "counters" : Counter(), "samples" : Counter()}
+        for snapshot in snapshots:
+            for kind, values in snapshot.items():
+                merged[kind].update(values)
+        return {kind : dict(values) for kind, values in merged.items()}
+
+    @staticmethod
+    def report(snapshot: dict) -> str:
+        """
+        Returns a short human-readable summary of a *snapshot*.
+        """
+        calls = snapshot["calls"]
+        lines = [f"{name:<20} {seconds:>9.3f}s  ({calls[name]} calls)"
+                 for name, seconds in sorted(snapshot["timers"].items(), key=lambda x: -x[1])]
+        lines += [f"{name:<20} {count:>10}" for name, count in sorted(snapshot["counters"].items())]
+        top = sorted(snapshot["samples"].items(), key=lambda x: -x[1])[:10]
+        lines += [f"sampled {name:<30} {count:>6}" for name, count in top]
+        return "\n".join(lines)
+
+
+metrics = Metrics()
@@ -0,0 +1,134 @@
+import itertools
+import numpy as np
+from solution import Solution, FitnessCache
+'''
+Memetic local search for the GA: hill climbing over moves of operations on a solution's critical path.
+
+Only critical operations can shorten the makespan, so the neighborhood is small, and every neighbor only differs from
+its parent from the first moved column on, so it is evaluated with *Solution.changed* instead of a full decode.
+'''
+
+def critical_path(sol: Solution) -> list[tuple[int, int]]:
+    """
+    Returns the (machine, position) of every operation on a critical path of *sol*, in time order:
+    a chain of operations each starting the moment the one before it ends, from time 0 to the makespan.
+    """
+    starts = sol.starts
+    sched = sol.schedule
+    num_machines = sched.shape[0]
+    ends = starts + Solution.data[np.arange(num_machines)[:, None], sched]
+
+    machine, col = (int(x) for x in np.unravel_index(np.argmax(ends), ends.shape))
+    path = [(machine, col)]
+    while starts[machine, col] > 0:
+        start = starts[machine, col]
+        # Every decoder starts an operation right after one on its machine, or right after one of its job's operations
+        same_machine = np.flatnonzero(ends[machine] == start)
+        if len(same_machine):
+            col = int(same_machine[0])
+        else:
+            rows, cols = np.nonzero((sched == sched[machine, col]) & (ends == start))
+            if len(rows) == 0:
+                break
+            machine, col = int(rows[0]), int(cols[0])
+        path.append((machine, col))
+
+    path.reverse()
+    return path
+
+def critical_moves(path: list[tuple[int, int]], num_jobs: int) -> list[tuple[str, int, int, int]]:
+    """
+    Returns the moves to try for a critical *path*, as (kind, machine, pos1, pos2) with kind "swap" or "insert"
+    (take the job at pos1 out and put it back in at pos2).
+
+    A run of consecutive path operations on one machine is a critical block. Its ends are swapped with their neighbors inside the block
+    and with each other, and each end is moved to the other end. An operation alone on its machine is swapped with its row neighbors.
+    """
+    moves = []
+    for machine, block in itertools.groupby(path, key=lambda op: op[0]):
+        cols = [col for _, col in block]
+        first, last = cols[0], cols[-1]
+        if first == last:
+            moves += [("swap", machine, first - 1, first), ("swap", machine, first, first + 1)]
+        else:
+            moves += [("swap", machine, first, first + 1), ("swap", machine, last - 1, last), ("swap", machine, first, last),
+                      ("insert", machine, last, first), ("insert", machine, first, last)]
+
+    # Drop moves falling off the row, and repeats (short blocks give the same swap more than once)
+    moves = [move for move in moves if 0 <= move[2] < num_jobs and 0 <= move[3] < num_jobs]
+    return list(dict.fromkeys(moves))
+
+def apply_move(sol: Solution, move: tuple[str, int, int, int]) -> Solution:
+    """
+    Returns the neighbor of *sol* reached by *move* (see *critical_moves*), evaluated incrementally.
+    """
+    kind, machine, pos1, pos2 = move
+    if kind == "swap":
+        return sol.swap(machine, pos1, pos2)
+
+    new_schedule = np.copy(sol.schedule)
+    row = new_schedule[machine]
+    job = row[pos1]
+    if pos1 < pos2:
+        row[pos1:pos2] = sol.schedule[machine, pos1+1:pos2+1]
+    else:
+        row[pos2+1:pos1+1] = sol.schedule[machine, pos2:pos1]
+    row[pos2] = job
+    return sol.changed(new_schedule, min(pos1, pos2))
+
+class LocalSearch:
+    """
+    First-improvement hill climbing on critical-path moves, which *genetic_algorithm* applies to its best solutions every generation.
+
+    Attributes:
+        num_elites (int):       how many of the best solutions are improved each generation
+        max_evals (int):        most neighbors evaluated per improved solution per generation
+        evaluations (int):      neighbors evaluated so far
+        improvements (int):     moves accepted so far
+        searches (int):         solutions searched so far (ones already known to be local optima are skipped)
+
+    """
+
+    def __init__(self, num_elites: int = 1, max_evals: int = 100):
+        self.num_elites = num_elites
+        self.max_evals = max_evals
+        self.optima = set()     # Cache keys of schedules no move improves, so surviving elites aren't searched again
+        self.evaluations = 0
+        self.improvements = 0
+        self.searches = 0
+
+    def improve(self, sol: Solution) -> Solution:
+        """
+        Returns *sol* after taking improving moves until none is left or the evaluation budget runs out.
+        """
+        if FitnessCache.key(sol.schedule) in self.optima:
+            return sol
+        self.searches += 1
+
+        evals = 0
+        while evals < self.max_evals:
+            improved = False
+            for move in critical_moves(critical_path(sol), sol.schedule.shape[1]):
+                if evals >= self.max_evals:
+                    return sol
+                neighbor = apply_move(sol, move)
+                evals += 1
+                self.evaluations += 1
+                if neighbor.makespan < sol.makespan:
+                    sol = neighbor
+                    self.improvements += 1
+                    improved = True
+                    break
+
+            if not improved:
+                if len(self.optima) >= 100000:
+                    self.optima.clear()
+                self.optima.add(FitnessCache.key(sol.schedule))
+                break
+
+        return sol
+
+    def stats(self) -> dict:
+        return {"evaluations" : self.evaluations,
+                "improvements" : self.improvements,
+                "searches" : self.searches}
@@ -1,13 +1,25 @@
 import os
+import argparse
+import queue
 import shutil
 import time
+import multiprocessing
+from collections import deque
+from collections.abc import Callable
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from solution import Solution, plot_solution
-from woc import aggregate
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from solution import Solution, FitnessCache, make_solutions
+from woc import Woc, aggregate, ensemble_variants, build_variants, evaluate_variants
 from ga import genetic_algorithm, plot_gens
+from shared import SharedArrays, attach
+from instrument import Metrics, metrics
+from instances import load_instance
+from local_search import LocalSearch
+from workers import ga_process, store_ga_result, ga_outputs, ga_unit, take_ga_result, ga_cores, collect_ga_results
+from render import Renderer, render_solution, write_tables, render_cores
+from checkpoint import GACheckpoint, experiment_dir, save_unit, load_unit
+from progress import ProgressRelay
 '''
 Main python file. 
 Script flow:
@@ -27,27 +39,10 @@ Script flow:
 def load_data(name: str) -> np.ndarray:
     """
     Loads data structure from given file name under "./data" directory.
+
+    Parsed files are cached as .npy under "./data/.cache" and memory-mapped on later loads (see instances.py).
     """
-    path = "./data/" + name
-    with open(path, 'r') as file:
-        file.readline()
-        line = file.readline()
-        n = int(line.strip().split(' ')[0])
-
-        data = []
-        file.readline()
-        for i in range(n):
-            data.append(file.readline().strip().split(' '))
-        data = np.array(data, dtype=np.int16)
-        
-        # the way the data is formatted is goofy, this "corrects" it
-        file.readline()
-        sort = []
-        for i in range(n):
-            sort = np.array(file.readline().strip().split(' '), dtype=np.int8) - 1
-            data[i][sort] = np.copy(data[i])    # copy is needed because it overwrites element by element, unlike tuple assignment for example
-        
-    return data.T
+    return load_instance(os.path.join("./data", name))
 
 def create_data(n: int, max_time=100, seed: int = None) -> np.ndarray:
     """
@@ -56,102 +51,472 @@ def create_data(n: int, max_time=100, seed: int = None) -> np.ndarray:
     np.random.seed(seed)
     return np.random.randint(1, max_time, size=(n, n))
 
-# Need this wrapper because processes have unique address spaces, so Solution.data doesn't hold.
-def ga_process(ga_params: tuple, data: np.ndarray) -> dict:
+def run_ga(n: int, ga_params: tuple, data: np.ndarray, engine: str = "list", cache_size: int = 0, stop: dict = None,
+           instrument: bool = False, sample_interval: float = None, local_search: dict = None, decoder: str = "insertion",
+           on_generation: Callable[[int, dict], None] = None) -> dict:
     """
-    Process function that runs ga with given *ga_params*.
+    Runs the genetic algorithm *n* times and returns a dict of (mostly statistic) results.
 
-    *data* is needed to reset address space.
+    *data* is published to the workers once through shared memory, and they write their results into shared arrays
+    that are only turned back into *Solution* objects here. Like in *execute_66*, only runs in flight have a slot in those:
+    a finished run's result is taken out of its slot right away, with its evolution curve folded into running stats,
+    so memory doesn't grow with *n* × generations.
+
+    *engine* picks the GA implementation, "list" or "tensor" (see ga.ENGINES).
+    *cache_size* > 0 turns on per-run fitness caching, and merged cache stats are returned under "cache_stats".
+    *stop* holds ga.Termination keyword arguments for every run. If one run hits the lower bound, the others are cancelled.
+    Why runs stopped is counted under "stop_reasons", and their mean length is under "avg_generations".
+    *instrument* turns on per-phase timers and counters in every run (and here), merged under "metrics";
+    *sample_interval* adds a sampling profile of the workers.
+    *local_search* holds local_search.LocalSearch keyword arguments, turning on the memetic stage in every run.
+    Mean evaluations per run are under "avg_evaluations", and if *stop* has a target, each run's evaluations to reach it under "evals_to_target".
+    *decoder* picks how schedules are evaluated (see solution.DECODERS).
+    If *on_generation* is given, it is called as on_generation(run index, ga.generation_stats dict) for every generation of every run
+    while they're going, from a background thread (see progress.py).
+
+    Sets Solution.data to *data* and Solution.decoder to *decoder*, since the returned solutions are built in this process.
     """
     Solution.data = data
-    return genetic_algorithm(*ga_params)
+    Solution.decoder = decoder
+    generations = ga_params[1]
+    num_slots = min(n, 2 * ga_cores())
+    unit = ga_unit(n, data.shape, generations)
+    with SharedArrays.share(data=data) as inputs, SharedArrays(ga_outputs(num_slots, data.shape, generations)) as outputs:
+        specs = inputs.specs | outputs.specs
+        with ProgressRelay(on_generation) as relay, ProcessPoolExecutor(max_workers=ga_cores(), **relay.pool_options) as executor:
+            options = {"engine" : engine, "cache_size" : cache_size, "stop" : stop, "instrument" : instrument, "sample_interval" : sample_interval,
+                       "local_search" : local_search, "decoder" : decoder}
+            queued = deque(range(n))
+            free_slots = list(range(num_slots))
+            futures = {}        # GA future -> (run index, slot)
+            ga_results = []
+
+            while queued or futures:
+                while queued and free_slots:
+                    i, slot = queued.popleft(), free_slots.pop()
+                    future = executor.submit(ga_process, ga_params, specs, slot, **options, progress=i if on_generation else None)
+                    futures[future] = (i, slot)
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i, slot = futures.pop(future)
+                    ga_results.append(future.result())
+                    take_ga_result(outputs, slot, unit, i)
+                    free_slots.append(slot)
+                    print(f"{len(ga_results)}/{n} GAs completed")
+
+        if instrument:
+            metrics.enable()
+        with metrics.phase("ipc"):
+            results = collect_ga_results(unit, range(n), ga_results, unit["evolution_stats"])
+        if instrument:
+            results["metrics"] = Metrics.merge([results["metrics"], metrics.snapshot()])
+            metrics.disable()
+        return results
+
+def island_process(ga_params: tuple, specs: dict, island: int, num_islands: int, interval: int, migrants: int, topology: str, seed: int, barrier,
+                   returns: multiprocessing.Queue, cache_size: int = 0, instrument: bool = False, sample_interval: float = None,
+                   local_search: dict = None, decoder: str = "insertion", target: float = None) -> None:
+    """
+    Process function for one island of *run_islands*. Runs the list GA with given *ga_params* and writes its results to slot *island*,
+    putting what's left of them (see *store_ga_result*) on the *returns* queue.
 
+    Every *interval* generations all islands post their *migrants* best schedules to the shared "mailbox", wait on *barrier*,
+    and swap their worst ones for the migrants of the island picked by *migration_source*.
 
-def run_ga(n: int, ga_params: tuple, data: np.ndarray) -> dict:
+    *cache_size*, *instrument*, *sample_interval*, *local_search* and *decoder* work like they do for *ga_process*.
+    If *target* is given, the evaluations the island took to first reach that makespan are returned under "evals_to_target"
+    (None if it never did). Islands can't stop there though, the others would wait on them forever.
     """
-    Runs the genetic algorithm *n* times and returns a dict of (mostly statistic) results.
+    if instrument:
+        metrics.enable(sample_interval)
+    np.random.seed()
+    arrays = attach(specs)
+    Solution.data = arrays["data"]
+    Solution.cache = FitnessCache(cache_size) if cache_size > 0 else None
+    Solution.decoder = decoder
+    mailbox = arrays["mailbox"]
+
+    def migrate(gen: int, population: list[Solution]) -> list[Solution]:
+        if (gen + 1) % interval != 0:
+            return population
+
+        epoch = (gen + 1) // interval
+        population.sort(key=lambda x: x.makespan)
+        mailbox[island] = [sol.schedule for sol in population[:migrants]]
+        barrier.wait()
+        incoming = make_solutions(np.copy(mailbox[migration_source(island, num_islands, epoch, topology, seed)]))
+        barrier.wait()     # Nobody posts again until everyone has read
+        return population[:len(population) - migrants] + incoming
+
+    reached = {"evals_to_target" : None}
+
+    def on_generation(stats: dict) -> None:
+        if reached["evals_to_target"] is None and stats["best"] <= target:
+            reached["evals_to_target"] = stats["evaluations"]
+
+    extra = {}
+    if local_search is not None:
+        extra["local_search"] = LocalSearch(**local_search)
+    if target is not None:
+        extra["on_generation"] = on_generation
+    try:
+        results = genetic_algorithm(*ga_params, migrate=migrate, **extra)
+    except BaseException:
+        # Don't leave the other islands waiting on us forever
+        barrier.abort()
+        raise
+    leftovers = store_ga_result(arrays, island, results)
+    if target is not None:
+        leftovers |= reached
+    if instrument:
+        leftovers["metrics"] = metrics.snapshot()
+        metrics.disable()
+    returns.put(leftovers)
+
+def migration_source(island: int, num_islands: int, epoch: int, topology: str, seed: int) -> int:
     """
-    cores = max(1, (2 * os.cpu_count()) // 3)       # Dedicate 2/3 of logical processors to producing genetic results
-    with ProcessPoolExecutor(max_workers=cores) as executor:
-        futures = [executor.submit(ga_process, ga_params, data) for _ in range(n)]
-        ga_results = []
-        ga_solutions = []
-        best_ms = float('inf')
-
-        for num_completed, future in enumerate(as_completed(futures), 1):
-            print(f"{num_completed}/{n} GAs completed")
-
-            ga_result = future.result()
-            ga_results.append(ga_result)
-            sol = ga_result["best_solution"]
-            ga_solutions.append(sol)
-
-            ms = sol.makespan
-            if  ms < best_ms:
-                best_ms = ms
-                best_sol = sol
-
-    results = {"ga_solutions" : ga_solutions,
-               "best_sol" : best_sol,
-               "best_ms" : best_ms,
-               "avg_ms" : np.mean([sol.makespan for sol in ga_solutions]),
-               "avg_evolution" : np.mean([result["evolution"] for result in ga_results], axis=0),
-               "avg_time" : np.mean([result["time"] for result in ga_results])}
-    return results
-
-def execute_66(data_sizes: list[int], iterations: int, pop_size: int = 100, num_gens: int = 100, num_ga: int = 24) -> list[dict]:
+    Returns which island *island* takes migrants from at migration number *epoch*.
+
+    "ring" always takes from the previous island. "random" links all islands into a new random cycle every epoch;
+    every island derives the same cycle from *seed* and *epoch*, so they don't need to agree on anything else.
     """
-    Does pretty much all the housekeeping for getting statistics.
-    
-    Takes a list of custom data sizes to use, *iterations* to average everything over.
+    if topology == "ring":
+        return (island - 1) % num_islands
 
-    Returned list gives results in same order as *data_sizes*.
+    assert topology == "random", f"Unknown island topology \"{topology}\""
+    cycle = np.random.default_rng((seed, epoch)).permutation(num_islands)
+    pos = np.flatnonzero(cycle == island)[0]
+    return int(cycle[pos - 1])
+
+def run_islands(n: int, ga_params: tuple, data: np.ndarray, interval: int = 10, migrants: int = 2, topology: str = "ring",
+                cache_size: int = 0, instrument: bool = False, sample_interval: float = None, local_search: dict = None,
+                decoder: str = "insertion", target: float = None) -> dict:
     """
-    assert iterations >= 1, "Need at least 1 iteration bro."
+    Island-model alternative to *run_ga*: *n* GAs (list engine) evolve side by side, one process each, and every *interval* generations
+    each island replaces its *migrants* worst individuals with the best ones of a neighbor ("ring" or "random" *topology*).
 
-    ga_params = (pop_size, num_gens)
-    all_res = []
+    *cache_size*, *instrument*, *sample_interval*, *local_search* and *decoder* are passed on to every island and reported like *run_ga* does.
+    If *target* is given, each island's evaluations to first reach that makespan are under "evals_to_target", like *run_ga* with a target *stop*.
+
+    Returns the same dict as *run_ga*, with every island's best solution in "ga_solutions".
+    Sets Solution.data to *data* and Solution.decoder to *decoder*, since the returned solutions are built in this process.
+    """
+    assert n >= 2, "Need at least 2 islands to migrate between."
+    assert 1 <= migrants < ga_params[0], "Migrants have to fit in an island's population."
 
-    for size in data_sizes:
-        print(f"Starting data_size {size}...")
-        res = dict()
-        Solution.data = create_data(size, seed=69)
+    Solution.data = data
+    Solution.decoder = decoder
+    layout = ga_outputs(n, data.shape, ga_params[1]) | {"mailbox" : ((n, migrants, *data.shape), np.intp)}
+    seed = int(np.random.randint(2**31))
+    with SharedArrays.share(data=data) as inputs, SharedArrays(layout) as outputs:
+        specs = inputs.specs | outputs.specs
+        barrier = multiprocessing.Barrier(n)
+        returns = multiprocessing.Queue()
+        options = {"cache_size" : cache_size, "instrument" : instrument, "sample_interval" : sample_interval,
+                   "local_search" : local_search, "decoder" : decoder, "target" : target}
+        islands = [multiprocessing.Process(target=island_process, args=(ga_params, specs, island, n, interval, migrants, topology, seed, barrier, returns),
+                                           kwargs=options)
+                   for island in range(n)]
+        for process in islands:
+            process.start()
+
+        # Drain the queue before joining, or an island can hang on exit flushing its leftovers into a full pipe
+        ga_results = []
+        while len(ga_results) < n and (any(process.is_alive() for process in islands) or not returns.empty()):
+            try:
+                ga_results.append(returns.get(timeout=1))
+            except queue.Empty:
+                pass
+        for process in islands:
+            process.join()
+        print(f"{n}/{n} islands completed")
+
+        failed = [island for island, process in enumerate(islands) if process.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"Islands {failed} crashed")
+
+        if instrument:
+            metrics.enable()
+        with metrics.phase("ipc"):
+            results = collect_ga_results(outputs, range(n), ga_results)
+        if instrument:
+            results["metrics"] = Metrics.merge([results["metrics"], metrics.snapshot()])
+            metrics.disable()
+        return results
+
+# Per-variant ensemble stats (see woc.evaluate_variants) that add up over iterations; "best", "beats_experts" and "repaired" end up as counts
+ENSEMBLE_SUMS = ("makespan", "vs_best_expert", "best", "beats_experts", "repaired")
+
+def add_iteration(res: dict, results: dict, woc_sol: Solution = None) -> dict:
+    """
+    Folds one iteration's *run_ga* *results* into the running totals *res* (None for the first one) and returns them.
 
-        # init res, kinda like a shitty do-while
-        print("Iteration 1")
-        res = results = run_ga(num_ga, ga_params, Solution.data)
+    Aggregates the iteration's GA solutions with WOC along the way, unless its *woc_sol* is given. Solution.data must hold the instance.
+    """
+    if woc_sol is None:
         woc_sol = aggregate(results["ga_solutions"])
+
+    # First iteration starts the totals, kinda like a shitty do-while
+    if res is None:
+        res = results
         del res["ga_solutions"]
         res["woc_sol"] = woc_sol
         res["woc_ms"] = woc_sol.makespan
-        print()
-
-        for i in range(iterations - 1):
-            print(f"Iteration {i+2}")
-            results = run_ga(num_ga, ga_params, Solution.data)
-
-            check = results["best_sol"]
-            if check.makespan < res["best_ms"]:
-                res["best_sol"] = check
-                res["best_ms"] = check.makespan
-            
-            woc_sol = aggregate(results["ga_solutions"])
-            res["woc_ms"] += woc_sol.makespan
-            if woc_sol.makespan < res["woc_sol"].makespan:
-                res["woc_sol"] = woc_sol
-
-            add = ("avg_ms", "avg_evolution", "avg_time")
-            for stat in add:
-                res[stat] += results[stat]
-
-            print()
-        
-        to_avg = ("avg_ms", "avg_evolution", "avg_time", "woc_ms")
-        for stat in to_avg:
+        return res
+
+    check = results["best_sol"]
+    if check.makespan < res["best_ms"]:
+        res["best_sol"] = check
+        res["best_ms"] = check.makespan
+
+    res["woc_ms"] += woc_sol.makespan
+    if woc_sol.makespan < res["woc_sol"].makespan:
+        res["woc_sol"] = woc_sol
+
+    res["avg_ms"] += results["avg_ms"]
+    # Curves and times are merged as running stats, never stacked
+    res["evolution_stats"] = res["evolution_stats"].merge(results["evolution_stats"])
+    res["time_stats"] = res["time_stats"].merge(results["time_stats"])
+    if "cache_stats" in res:
+        res["cache_stats"] = FitnessCache.merge_stats([res["cache_stats"], results["cache_stats"]])
+    if "metrics" in res:
+        res["metrics"] = Metrics.merge([res["metrics"], results["metrics"]])
+    if "stop_reasons" in res:
+        res["stop_reasons"] += results["stop_reasons"]
+        res["avg_generations"] += results["avg_generations"]
+        res["avg_evaluations"] += results["avg_evaluations"]
+    if "evals_to_target" in res:
+        res["evals_to_target"] += results["evals_to_target"]
+    if "local_search" in res:
+        res["local_search"] = {stat : count + results["local_search"][stat] for stat, count in res["local_search"].items()}
+    if "ensemble" in res:
+        # Variants go by name, so bootstrap variants sum over different samples
+        for name, stats in res["ensemble"].items():
+            for stat in ENSEMBLE_SUMS:
+                stats[stat] += results["ensemble"][name][stat]
+    return res
+
+def average_iterations(res: dict, iterations: int) -> dict:
+    """
+    Turns the totals built by *add_iteration* into averages over *iterations*.
+    Evolution curves and times are averaged over every run instead, with their standard deviations alongside.
+    """
+    to_avg = ("avg_ms", "woc_ms", "avg_generations", "avg_evaluations")
+    for stat in to_avg:
+        if stat in res:
             res[stat] /= iterations
-        
-        all_res.append(res)
+    res["avg_evolution"], res["std_evolution"] = res["evolution_stats"].mean, res["evolution_stats"].std
+    res["avg_time"], res["std_time"] = res["time_stats"].mean, res["time_stats"].std
+    for stats in res.get("ensemble", {}).values():
+        stats["makespan"] /= iterations
+        stats["vs_best_expert"] /= iterations
+    return res
+
+def execute_66(data_sizes: list[int], iterations: int, pop_size: int = 100, num_gens: int = 100, num_ga: int = 24, engine: str = "list", cache_size: int = 0,
+               island_params: dict = None, stop: dict = None, instrument: bool = False, sample_interval: float = None,
+               local_search: dict = None, decoder: str = "insertion", on_result: Callable[[int, dict], None] = None,
+               checkpoint_every: int = 0, woc_ensemble: dict = None, on_generation: Callable[[tuple, dict], None] = None) -> list[dict]:
+    """
+    Does pretty much all the housekeeping for getting statistics.
+    
+    Takes a list of custom data sizes to use, *iterations* to average everything over.
+    *engine*, *cache_size*, *stop*, *instrument*, *sample_interval*, *local_search* and *decoder* are passed on to *ga_process*;
+    the GAs of one iteration are siblings for cancellation.
+
+    Every (size, iteration, GA) run goes into one queue on a single worker pool that lives for the whole experiment,
+    so cores don't wait for an iteration's stragglers. Each GA is added to its iteration's WOC crowd as it finishes,
+    so the aggregate is ready as soon as the iteration's last GA is.
+    Only a few GAs are in flight at a time, and each size's shared output arrays only have a slot for each of those:
+    a finished GA's result is taken out of its slot right away, with its evolution curve folded into its iteration's running stats,
+    so memory doesn't grow with *iterations* or *num_gens* × *iterations*.
+
+    If *island_params* is given (keyword arguments of *run_islands*, may be empty), each iteration is instead one island-model run
+    with *num_ga* islands, which get *cache_size*, *instrument*, *sample_interval*, *local_search* and *decoder* too.
+    Those have to run side by side, so iterations then go one after another, *engine* has to be "list" and *stop* isn't supported
+    (give *island_params* a "target" to still count evaluations to it).
+
+    If *on_result* is given, it is called as on_result(size index, results) as soon as a size's results are final,
+    e.g. to start rendering them while the other sizes are still running.
+
+    If *checkpoint_every* is positive, the run can be killed and restarted with the same arguments without losing much (see checkpoint.py):
+    every GA saves its population every *checkpoint_every* generations, and every finished (size, iteration) is saved as a whole.
+    A restart skips finished iterations and picks unfinished GAs up from their last save. The checkpoints are deleted once everything is done.
+    Islands don't checkpoint.
+
+    If *woc_ensemble* is given (keyword arguments of woc.ensemble_variants, may be empty), every iteration's aggregate is the best
+    of an ensemble of WOC variants over different expert subsets and weightings, built on the worker pool and decoded in one batch,
+    instead of the single crowd. Per-variant stats, summed over iterations (makespans averaged), are then under "ensemble".
+    Islands don't build ensembles.
 
+    If *on_generation* is given, it is called as on_generation((size index, iteration, GA index), ga.generation_stats dict)
+    for every generation of every GA while they're going, from a background thread (see progress.py). Islands don't report progress.
+
+    Returned list gives results in same order as *data_sizes*.
+    """
+    assert iterations >= 1, "Need at least 1 iteration bro."
+
+    ga_params = (pop_size, num_gens)
+    Solution.decoder = decoder
+    if island_params is not None:
+        assert engine == "list", "Only the list GA can migrate."
+        assert stop is None, "Islands migrate in lockstep, so they can't stop early."
+        assert checkpoint_every == 0, "Islands can't be checkpointed."
+        assert woc_ensemble is None, "Islands only aggregate with a single crowd."
+        assert on_generation is None, "Islands don't report progress."
+        all_res = []
+        for size in data_sizes:
+            print(f"Starting data_size {size}...")
+            data = create_data(size, seed=69)
+            res = None
+            for i in range(iterations):
+                print(f"Iteration {i+1}")
+                res = add_iteration(res, run_islands(num_ga, ga_params, data, cache_size=cache_size, instrument=instrument,
+                                                     sample_interval=sample_interval, local_search=local_search, decoder=decoder,
+                                                     **island_params))
+            all_res.append(average_iterations(res, iterations))
+            if on_result is not None:
+                on_result(len(all_res) - 1, all_res[-1])
+        return all_res
+
+    all_res = [None] * len(data_sizes)
+    datas = [create_data(size, seed=69) for size in data_sizes]
+    max_in_flight = 2 * ga_cores()      # GAs handed to the pool at once, so ensemble candidates can be built without waiting behind every queued GA
+    num_slots = min(iterations * num_ga, max_in_flight)
+    shared = [None] * len(data_sizes)   # shared[i] is the (inputs, outputs) SharedArrays of the ith size, from its first GA until it's finished
+    free_slots = [None] * len(data_sizes)
+    units = {}          # (size index, iteration) -> ga_unit its finished GAs' results are taken into
+    done = {}           # (size index, iteration) -> leftover dicts of its finished GAs
+    crowds = {}         # (size index, iteration) -> streaming Woc of its finished GAs
+    ensembles = {}      # (size index, iteration) -> its ensemble's variants, expert makespans, GA leftovers and candidate futures
+    iterations_left = [iterations] * len(data_sizes)
+
+    options = {"engine" : engine, "cache_size" : cache_size, "stop" : stop, "instrument" : instrument, "sample_interval" : sample_interval,
+               "local_search" : local_search, "decoder" : decoder}
+    if checkpoint_every > 0:
+        # Instrumented runs return metrics the others don't, so they don't share checkpoints either
+        ckpt_dir = experiment_dir(pop_size=pop_size, num_gens=num_gens, num_ga=num_ga, engine=engine, cache_size=cache_size, stop=stop,
+                                  instrument=instrument, sample_interval=sample_interval, local_search=local_search, decoder=decoder,
+                                  rates=(Solution.cross_rate, Solution.mutate_rate), woc_ensemble=woc_ensemble)
+        unit_path = lambda size_ind, i: os.path.join(ckpt_dir, f"{data_sizes[size_ind]}_{i}.npz")
+        ga_path = lambda size_ind, i, j: os.path.join(ckpt_dir, f"{data_sizes[size_ind]}_{i}_{j}.ga.npz")
+
+    def share_size(size_ind: int) -> tuple[SharedArrays, SharedArrays]:
+        # Shared arrays of a size, made when its first GA is handed to the pool
+        if shared[size_ind] is None:
+            data = datas[size_ind]
+            shared[size_ind] = (SharedArrays.share(data=data), SharedArrays(ga_outputs(num_slots, data.shape, num_gens, groups=iterations)))
+            free_slots[size_ind] = list(range(num_slots))
+        return shared[size_ind]
+
+    def finish_iteration(size_ind: int, i: int, unit: dict, ga_results: list[dict], woc_schedule: np.ndarray, ensemble_stats: list[dict] = None) -> None:
+        # Folds a finished iteration into its size's totals, and wraps the size up after its last one
+        Solution.data = datas[size_ind]
+        results = collect_ga_results(unit, range(num_ga), ga_results, unit["evolution_stats"])
+        if ensemble_stats is not None:
+            results["ensemble"] = {stat["name"] : stat for stat in ensemble_stats}
+        all_res[size_ind] = add_iteration(all_res[size_ind], results, Solution(woc_schedule))
+
+        iterations_left[size_ind] -= 1
+        if iterations_left[size_ind] == 0:
+            average_iterations(all_res[size_ind], iterations)
+            if on_result is not None:
+                on_result(size_ind, all_res[size_ind])
+            if shared[size_ind] is not None:
+                for group in shared[size_ind]:
+                    group.close()
+                shared[size_ind] = None
+
+    def complete_iteration(size_ind: int, i: int, ga_results: list[dict], woc_schedule: np.ndarray, ensemble_stats: list[dict] = None) -> None:
+        # Checkpoints an iteration whose aggregate is ready, then finishes it
+        unit = units.pop((size_ind, i))
+        if checkpoint_every > 0:
+            save_unit(unit_path(size_ind, i), unit, ga_results, woc_schedule, ensemble_stats)
+            for j in range(num_ga):
+                GACheckpoint(ga_path(size_ind, i, j)).clear()
+        finish_iteration(size_ind, i, unit, ga_results, woc_schedule, ensemble_stats)
+
+    try:
+        with ProgressRelay(on_generation) as relay, ProcessPoolExecutor(max_workers=ga_cores(), **relay.pool_options) as executor:
+            queued = deque()    # (size index, iteration, GA index, options) of GAs not handed to the pool yet
+            for size_ind in range(len(datas)):
+                for i in range(iterations):
+                    if checkpoint_every > 0 and os.path.exists(unit_path(size_ind, i)):
+                        print(f"Data size {data_sizes[size_ind]}, iteration {i+1} restored from checkpoint")
+                        finish_iteration(size_ind, i, *load_unit(unit_path(size_ind, i)))
+                        continue
+                    for j in range(num_ga):
+                        if checkpoint_every > 0:
+                            options = options | {"checkpoint" : GACheckpoint(ga_path(size_ind, i, j), checkpoint_every)}
+                        if on_generation is not None:
+                            options = options | {"progress" : (size_ind, i, j)}
+                        queued.append((size_ind, i, j, options))
+
+            futures = {}        # GA future -> (size index, iteration, GA index, slot)
+            builds = {}         # ensemble future -> (size index, iteration)
+            pending = set()
+            num_gas = len(queued)
+            num_completed = 0
+            while queued or pending:
+                while queued and len(pending) < max_in_flight:
+                    size_ind, i, j, ga_options = queued.popleft()
+                    inputs, outputs = share_size(size_ind)
+                    slot = free_slots[size_ind].pop()
+                    future = executor.submit(ga_process, ga_params, inputs.specs | outputs.specs, slot, i, **ga_options)
+                    futures[future] = (size_ind, i, j, slot)
+                    pending.add(future)
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in builds:
+                        size_ind, i = builds.pop(future)
+                        ensemble = ensembles[(size_ind, i)]
+                        if any(build in builds for build in ensemble["builds"]):
+                            continue
+                        del ensembles[(size_ind, i)]
+                        Solution.data = datas[size_ind]
+                        candidates = np.concatenate([build.result() for build in ensemble["builds"]])
+                        woc_sol, ensemble_stats = evaluate_variants(candidates, ensemble["variants"], ensemble["makespans"])
+                        complete_iteration(size_ind, i, ensemble["ga_results"], woc_sol.schedule, ensemble_stats)
+                        continue
+
+                    num_completed += 1
+                    size_ind, i, j, slot = futures.pop(future)
+                    ga_results = done.setdefault((size_ind, i), [])
+                    ga_results.append(future.result())
+                    unit = units.setdefault((size_ind, i), ga_unit(num_ga, datas[size_ind].shape, num_gens))
+                    take_ga_result(shared[size_ind][1], slot, unit, j)
+                    free_slots[size_ind].append(slot)
+                    if woc_ensemble is None:
+                        crowd = crowds.setdefault((size_ind, i), Woc.streaming(datas[size_ind].shape))
+                        crowd.add_expert(unit["schedules"][j], unit["makespans"][j])
+                    if len(ga_results) < num_ga:
+                        continue
+
+                    print(f"Data size {data_sizes[size_ind]}, iteration {i+1} done ({num_completed}/{num_gas} GAs completed)")
+                    del done[(size_ind, i)]
+                    if woc_ensemble is None:
+                        complete_iteration(size_ind, i, ga_results, crowds.pop((size_ind, i)).create_solution())
+                        continue
+
+                    # Candidates are built in a few chunks on the pool, and decoded together here once they're all back
+                    experts, makespans = unit["schedules"], unit["makespans"]
+                    variants = ensemble_variants(makespans, **woc_ensemble)
+                    chunks = [chunk for chunk in np.array_split(np.arange(len(variants)), ga_cores()) if len(chunk)]
+                    ensembles[(size_ind, i)] = {"variants" : variants, "makespans" : makespans, "ga_results" : ga_results, "builds" : []}
+                    for chunk in chunks:
+                        build = executor.submit(build_variants, experts, makespans, [variants[ind] for ind in chunk])
+                        builds[build] = (size_ind, i)
+                        ensembles[(size_ind, i)]["builds"].append(build)
+                        pending.add(build)
+    finally:
+        for groups in shared:
+            if groups is not None:
+                for group in groups:
+                    group.close()
+
+    if checkpoint_every > 0:
+        shutil.rmtree(ckpt_dir)
     return all_res
 
 
@@ -207,65 +572,71 @@ def execute_66(data_sizes: list[int], iterations: int, pop_size: int = 100, num_
 #         printf(lol)
 
 
-def main():
+def main(woc_ensemble: bool = False):
+    """
+    Runs the experiment on random instances and writes its plots and tables under "./output".
+
+    If *woc_ensemble* is set, each iteration is aggregated with the best of an ensemble of WOC variants (see execute_66)
+    instead of the single crowd. That's a different number, so it's reported as "Ensemble" instead of "Aggregate".
+    """
     start = time.time()
+    woc_label = "Ensemble" if woc_ensemble else "Aggregate"
 
     data_sizes = range(20, 36, 5)
     data_sizes = sorted(list(set(data_sizes)))
     iterations = 30
     num_ga = 24
-    print("\033[1;31mExecuting order 66\033[0m\n")
-    res_time = time.time()
-    results = execute_66(data_sizes, iterations, num_ga=num_ga)
-    res_time = time.time() - res_time
 
     with open("./output/results.txt", 'w') as output_file:
         def printf(*args, **kwargs):
             kwargs["file"] = output_file
             print(*args, **kwargs)
-        
-        printf("----------------------------------------\n")
-        df_data = []
-
-        for size, result in zip(data_sizes, results):
-            printf(f"Results for data size {size}\n")
-            printf(f"Average GA makespan:\t\t {result["avg_ms"]:.2f}")
-            printf(f"Best GA makespan:\t\t\t {result["best_ms"]:.2f}")
-            printf(f"Aggregate makespan:\t\t\t {result["woc_ms"]:.2f}")
-            printf(f"Average time per GA:\t\t {result["avg_time"]:.3f}s")
-            printf("\n----------------------------------------\n")
-
-            xlim = max(result["best_ms"], result["woc_ms"])
-            save_name = f"custom_{size}"
-            plot_solution(result["woc_sol"], xlim, "Aggregated", save_path=f"aggregate/{save_name}")
-            plot_solution(result["best_sol"], xlim, "Best genetic", save_path=f"ga/{save_name}")
-            plot_gens(result["avg_evolution"], f"n={size}", save_path=save_name)
-
-            df_data.append((size, result["avg_ms"], result["best_ms"], result["woc_ms"], 
-                            (result["avg_ms"] - result["woc_ms"]) / result["avg_ms"] * 100,
-                            num_ga * result["avg_time"]))
-
-
-        columns = ["# of Jobs/Machines", "Avg. Pop. Makespan", "Best Pop. Makespan", "Aggregate Makespan", 
-                   "WOC Improvement (%)", 
-                   "Pop. Init. Time (s)"]
-        df = pd.DataFrame(df_data, columns=columns).round(2)
-        df["# of Jobs/Machines"] = df["# of Jobs/Machines"].astype(str)
-        df_path = "./output/tables/custom"
-        df.to_csv(df_path + ".csv", index=False)
-        df.to_html(df_path + ".html", index=False)
-        df.to_latex(df_path + ".tex", index=False, float_format="%.2f")
-        def df_to_png(df, path):
-            fig, ax = plt.subplots(figsize=(10, 8))
-            ax.axis('off')
-            table = ax.table(cellText=df.values, colLabels=df.columns, cellLoc='center', loc='center')
-            table.auto_set_font_size(False)
-            table.set_fontsize(7)
-            table.scale(1, 2)
-            plt.savefig(path, bbox_inches='tight', dpi=400)
-            plt.clf()
-        df_to_png(df, df_path + ".png")
-        
+
+        # Plots and tables are drawn in the background, each size's as soon as it's done
+        with Renderer(render_cores(ga_cores())) as renderer:
+            def render_size(size_ind: int, result: dict) -> None:
+                xlim = max(result["best_ms"], result["woc_ms"])
+                save_name = f"custom_{data_sizes[size_ind]}"
+                renderer.submit(render_solution, result["woc_sol"], Solution.data, Solution.decoder, xlim, "Ensemble" if woc_ensemble else "Aggregated", save_path=f"aggregate/{save_name}")
+                renderer.submit(render_solution, result["best_sol"], Solution.data, Solution.decoder, xlim, "Best genetic", save_path=f"ga/{save_name}")
+                renderer.submit(plot_gens, result["avg_evolution"], f"n={data_sizes[size_ind]}", save_path=save_name)
+
+            print("\033[1;31mExecuting order 66\033[0m\n")
+            res_time = time.time()
+            results = execute_66(data_sizes, iterations, num_ga=num_ga, on_result=render_size, checkpoint_every=5,
+                                 woc_ensemble={} if woc_ensemble else None)
+            res_time = time.time() - res_time
+
+            printf("----------------------------------------\n")
+            df_data = []
+
+            for size, result in zip(data_sizes, results):
+                printf(f"Results for data size {size}\n")
+                printf(f"Average GA makespan:\t\t {result["avg_ms"]:.2f}")
+                printf(f"Best GA makespan:\t\t\t {result["best_ms"]:.2f}")
+                printf(f"{woc_label} makespan:\t\t\t {result["woc_ms"]:.2f}")
+                printf(f"Average time per GA:\t\t {result["avg_time"]:.3f}s")
+                if "cache_stats" in result:
+                    printf(f"Cache hit rate:\t\t\t\t {100 * result["cache_stats"]["hit_rate"]:.1f}% ({result["cache_stats"]["hits"]} make_starts calls saved)")
+                if "ensemble" in result:
+                    top = sorted(result["ensemble"].values(), key=lambda stats: stats["makespan"])[:3]
+                    printf("Best WOC variants:\t\t\t " + ", ".join(f"{stats["name"]} {stats["makespan"]:.2f} ({stats["best"]} wins)" for stats in top))
+                printf("\n----------------------------------------\n")
+
+                df_data.append((size, result["avg_ms"], result["best_ms"], result["woc_ms"], 
+                                (result["avg_ms"] - result["woc_ms"]) / result["avg_ms"] * 100,
+                                num_ga * result["avg_time"]))
+
+
+            columns = ["# of Jobs/Machines", "Avg. Pop. Makespan", "Best Pop. Makespan", f"{woc_label} Makespan", 
+                       "WOC Ensemble Improvement (%)" if woc_ensemble else "WOC Improvement (%)", 
+                       "Pop. Init. Time (s)"]
+            df = pd.DataFrame(df_data, columns=columns).round(2)
+            df["# of Jobs/Machines"] = df["# of Jobs/Machines"].astype(str)
+            renderer.submit(write_tables, df, "./output/tables/custom")
+            render_wait = time.time()
+        render_wait = time.time() - render_wait
+
 
         end = time.time()
         lol = f"Whole thing took:\t{end - start:.3f}s"
@@ -274,6 +645,7 @@ def main():
             printf(*args, **kwargs)
         printb()
         printb(f"Results took:\t{res_time:.3f}s")
+        printb(f"Waiting on renders took:\t{render_wait:.3f}s")
         printb(lol)
 
 
@@ -291,5 +663,9 @@ def reset_output() -> None:
         os.makedirs(dir)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the GA + WOC experiment on random instances, writing plots and tables under ./output.")
+    parser.add_argument("--woc-ensemble", action="store_true",
+                        help="aggregate with the best of an ensemble of WOC variants instead of a single crowd (reported in its own columns)")
+    args = parser.parse_args()
     reset_output()
-    main()
+    main(args.woc_ensemble)
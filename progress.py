@@ -0,0 +1,127 @@
+from __future__ import annotations
+import threading
+import multiprocessing
+from collections.abc import Callable, Hashable
+import numpy as np
+'''
+Live progress of GA runs, and statistics that don't need every run kept around.
+
+Workers report every generation (see ga.genetic_algorithm's *on_generation*) through a queue they get when the pool starts:
+
+    with ProgressRelay(callback) as relay, ProcessPoolExecutor(**relay.pool_options) as executor:
+        executor.submit(workers.ga_process, ..., progress=key)
+
+and the parent calls callback(key, stats) for every generation of every run as the reports come in, on a background thread.
+
+*RunningStats* keeps a mean and variance of everything added to it in constant memory, so sweeps over many runs
+hold one array per statistic instead of every run's curve.
+'''
+
+class RunningStats:
+    """
+    Running mean and variance of same-shaped values (Welford's algorithm), elementwise for arrays.
+
+    Attributes:
+        count (int):        values added so far
+        mean (np.ndarray):  their mean (a numpy scalar for scalar values)
+        var (np.ndarray):   their (population) variance
+        std (np.ndarray):   their standard deviation
+
+    """
+
+    def __init__(self, shape: tuple = ()):
+        self.count = 0
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+
+    def add(self, value: np.ndarray | float) -> None:
+        self.count += 1
+        delta = value - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (value - self._mean)
+
+    def merge(self, other: RunningStats) -> RunningStats:
+        """
+        Returns the stats of everything added to this or *other* (Chan et al.'s pairwise update), leaving both as they are.
+        """
+        merged = RunningStats(self._mean.shape)
+        merged.count = self.count + other.count
+        if merged.count == 0:
+            return merged
+        delta = other._mean - self._mean
+        merged._mean = self._mean + delta * (other.count / merged.count)
+        merged._m2 = self._m2 + other._m2 + delta**2 * (self.count * other.count / merged.count)
+        return merged
+
+    def state(self) -> tuple[int, np.ndarray, np.ndarray]:
+        """
+        Returns (count, mean, sum of squared deviations), which *from_state* turns back into the same stats, e.g. after saving them.
+        """
+        return self.count, self._mean, self._m2
+
+    @classmethod
+    def from_state(cls, count: int, mean: np.ndarray, m2: np.ndarray) -> RunningStats:
+        stats = cls(np.shape(mean))
+        stats.count = int(count)
+        stats._mean = np.array(mean, dtype=float)
+        stats._m2 = np.array(m2, dtype=float)
+        return stats
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self._mean[()]
+
+    @property
+    def var(self) -> np.ndarray:
+        return (self._m2 / max(self.count, 1))[()]
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+
+# This worker's end of the relay's queue, set by *init_worker* when the pool starts it
+_queue = None
+
+def init_worker(queue) -> None:
+    global _queue
+    _queue = queue
+
+def reporter(key: Hashable) -> Callable[[dict], None]:
+    """
+    Returns the *on_generation* callback of a worker's run, which sends its stats to the parent under *key*.
+    """
+    assert _queue is not None, "The pool wasn't started with a ProgressRelay's pool_options."
+    return lambda stats: _queue.put((key, stats))
+
+class ProgressRelay:
+    """
+    Parent end of the progress queue: hands every (key, stats) a worker reports to *callback*, on a background thread.
+
+    With no *callback* it does nothing, and its *pool_options* are empty, so callers don't need a separate path for it.
+    """
+
+    def __init__(self, callback: Callable[[Hashable, dict], None] = None):
+        self.callback = callback
+        self.queue = None
+        self.thread = None
+        self.pool_options = {}
+
+    def __enter__(self) -> ProgressRelay:
+        if self.callback is not None:
+            self.queue = multiprocessing.SimpleQueue()
+            self.pool_options = {"initializer" : init_worker, "initargs" : (self.queue,)}
+            self.thread = threading.Thread(target=self.relay, daemon=True)
+            self.thread.start()
+        return self
+
+    def relay(self) -> None:
+        for key, stats in iter(self.queue.get, None):
+            self.callback(key, stats)
+
+    def __exit__(self, *exc) -> None:
+        # Workers put their reports before returning, so once the pool is shut down they're all ahead of this
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue.close()
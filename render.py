@@ -0,0 +1,91 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from solution import Solution, plot_solution
+'''
+Background rendering of result artifacts (solution plots, evolution plots and result tables).
+
+Artifacts are handed to a *Renderer*, whose worker processes draw and write them while the experiment keeps computing.
+Nothing here returns anything; errors only surface when the renderer is drained.
+'''
+
+def _init_worker() -> None:
+    # Workers only ever write files
+    matplotlib.use("Agg")
+
+class Renderer:
+    """
+    Small process pool that artifact jobs are submitted to, fire-and-forget.
+
+    Use it as a context manager: leaving the block drains it (waits for every job, re-raising the first error) and shuts it down.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        self.futures = []
+
+    def submit(self, func, *args, **kwargs) -> None:
+        """
+        Queues func(*args, **kwargs), which must be picklable, in a worker.
+        """
+        self.futures.append(self.executor.submit(func, *args, **kwargs))
+
+    def drain(self) -> None:
+        """
+        Waits until every job submitted so far is done.
+        """
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+    def close(self) -> None:
+        try:
+            self.drain()
+        finally:
+            self.executor.shutdown()
+
+    def __enter__(self) -> "Renderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def render_solution(solution: Solution, data: np.ndarray, decoder: str, *args, **kwargs) -> None:
+    """
+    *plot_solution* for a worker, which needs the *data* and *decoder* of the parent's *Solution* class to plot *solution*.
+    """
+    Solution.data = data
+    Solution.decoder = decoder
+    plot_solution(solution, *args, **kwargs)
+
+def df_to_png(df: pd.DataFrame, path: str, dpi: int = 400) -> None:
+    """
+    Saves *df* as a table image at *path*.
+    """
+    fig, ax = plt.subplots(figsize=(10, 8))
+    ax.axis('off')
+    table = ax.table(cellText=df.values, colLabels=df.columns, cellLoc='center', loc='center')
+    table.auto_set_font_size(False)
+    table.set_fontsize(7)
+    table.scale(1, 2)
+    fig.savefig(path, bbox_inches='tight', dpi=dpi)
+    plt.close(fig)
+
+def write_tables(df: pd.DataFrame, path: str) -> None:
+    """
+    Exports *df* next to *path* as .csv, .html, .tex and .png.
+    """
+    df.to_csv(path + ".csv", index=False)
+    df.to_html(path + ".html", index=False)
+    df.to_latex(path + ".tex", index=False, float_format="%.2f")
+    df_to_png(df, path + ".png")
+
+def render_cores(busy: int) -> int:
+    """
+    Returns how many render workers to run next to *busy* compute workers.
+    """
+    return max(1, os.cpu_count() - busy)
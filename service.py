@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import argparse
+import functools
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from solution import Solution, DECODERS, random_schedules, make_solutions
+from woc import Woc
+from ga import ENGINES
+from instances import load_instance
+from shared import SharedArrays
+from workers import ga_process, ga_outputs, ga_cores
+from solve import instance_result
+'''
+Long-running local solver service, so repeated solves don't pay for process startup, imports, kernel loading and instance parsing.
+
+    python service.py serve [--socket ./ossp.sock | --port 8765] [--workers N] [--cache 32]
+    python service.py solve data/tai44_0.txt [--evals 2000] [--socket ./ossp.sock | --port 8765]
+
+The protocol is JSON lines over a Unix socket (or localhost TCP). A client sends one request per line:
+
+    {"path" : "data/tai44_0.txt"} or {"instance" : [[...], ...]}, plus any of
+    "time_limit", "evals", "generations", "num_ga", "pop_size", "engine", "decoder" (same meaning as in solve.py)
+
+and gets back a {"event" : "progress", ...} line per finished GA, then one {"event" : "result", ...} line
+(solve.py's instance line, with the best schedule) or {"event" : "error", "message" : ...}.
+Requests wait in a queue and a few are solved at a time, all on one pool of warm GA workers.
+Recently used instances stay in shared memory, and the workers stay attached to them.
+Closing the connection cancels the request's GAs.
+'''
+
+DEFAULTS = {"num_ga" : 8,
+            "pop_size" : 100,
+            "engine" : "list",
+            "decoder" : "insertion",
+            "time_limit" : None,
+            "evals" : None,
+            "generations" : None}
+
+def _warm_up() -> None:
+    # Load (or compile) every kernel once per process, instead of during the first request.
+    # Kernels are specialized on the data's dtype, which instances.py fits to each instance.
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        Solution.data = np.random.randint(1, 10, size=(4, 4)).astype(dtype)
+        for decoder in DECODERS:
+            Solution.decoder = decoder
+            make_solutions(random_schedules(2, Solution.data.shape))
+        Solution.decoder = "insertion"
+        for engine in ENGINES.values():
+            engine(20, 2)
+    Solution.data = None
+
+class InstanceCache:
+    """
+    The most recently used instances, each shared with the workers once, by content.
+
+    Attributes:
+        size (int):         instances kept around when not in use
+        entries (dict):     key -> [SharedArrays holding "data", requests using it], least recently used first
+
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def key(data: np.ndarray) -> str:
+        return hashlib.blake2b(f"{data.dtype.str}{data.shape}".encode() + data.tobytes(), digest_size=16).hexdigest()
+
+    def acquire(self, data: np.ndarray) -> tuple[str, SharedArrays]:
+        """
+        Returns the key and shared copy of *data*, which stays around at least until it's *release*d.
+        """
+        key = self.key(data)
+        if key not in self.entries:
+            self.entries[key] = [SharedArrays.share(data=data), 0]
+        self.entries.move_to_end(key)
+        self.entries[key][1] += 1
+        self.evict()
+        return key, self.entries[key][0]
+
+    def release(self, key: str) -> None:
+        self.entries[key][1] -= 1
+        self.evict()
+
+    def evict(self) -> None:
+        unused = [key for key, (_, users) in self.entries.items() if users == 0]
+        for key in unused[:max(0, len(self.entries) - self.size)]:
+            self.entries.pop(key)[0].close()
+
+    def close(self) -> None:
+        for inputs, _ in self.entries.values():
+            inputs.close()
+        self.entries.clear()
+
+class SolverService:
+    """
+    Queue of solve requests in front of a pool of warm GA workers (see module docstring).
+    """
+
+    def __init__(self, workers: int = ga_cores(), cache_size: int = 32, concurrent: int = 2):
+        self.workers = workers
+        self.concurrent = concurrent
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+        self.instances = InstanceCache(cache_size)
+        self.queue = asyncio.Queue()
+        self.decoding = asyncio.Lock()     # Solution.data is process-wide, so requests take turns decoding their results
+
+    async def serve(self, path: str = None, port: int = None) -> None:
+        """
+        Serves on the Unix socket at *path*, or on localhost *port* if given, until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        # Start every worker now, so no request waits for one to come up. This process decodes the WOC solutions.
+        _warm_up()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+        dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.concurrent)]
+        if port is not None:
+            server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        else:
+            server = await asyncio.start_unix_server(self.handle, path)
+        print(f"Serving on {port or path} with {self.workers} workers", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+            self.executor.shutdown(cancel_futures=True)
+            self.instances.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves one connection: its requests are queued one at a time, and their events written back as they come.
+        """
+        job = None
+        next_line = asyncio.ensure_future(reader.readline())
+        try:
+            while line := await next_line:
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as err:
+                    # Can't tell where the next request starts after a broken line, so say why and hang up
+                    writer.write(json.dumps({"event" : "error", "message" : f"{type(err).__name__}: {err}"}).encode() + b"\n")
+                    await writer.drain()
+                    return
+                job = {"request" : request, "events" : asyncio.Queue(), "cancelled" : False, "stop_flags" : None}
+                await self.queue.put(job)
+                # Keep reading while it runs, to notice the client leaving
+                next_line = asyncio.ensure_future(reader.readline())
+                while True:
+                    event = asyncio.ensure_future(job["events"].get())
+                    if not next_line.done():
+                        await asyncio.wait((event, next_line), return_when=asyncio.FIRST_COMPLETED)
+                    if not event.done() and not next_line.result():
+                        event.cancel()
+                        return
+                    event = await event
+                    writer.write(json.dumps(event).encode() + b"\n")
+                    await writer.drain()
+                    if event["event"] != "progress":
+                        job = None
+                        break
+        except ConnectionError:
+            pass
+        finally:
+            # A client that left doesn't need its GAs anymore
+            if job is not None:
+                job["cancelled"] = True
+                if job["stop_flags"] is not None:
+                    job["stop_flags"][0] = 1
+            next_line.cancel()
+            writer.close()
+
+    async def dispatch(self) -> None:
+        while True:
+            job = await self.queue.get()
+            if job["cancelled"]:
+                continue
+            try:
+                await self.solve(job["request"], job)
+            except Exception as err:
+                await job["events"].put({"event" : "error", "message" : f"{type(err).__name__}: {err}"})
+
+    async def solve(self, request: dict, job: dict) -> None:
+        """
+        Runs the GAs of *request* on the pool, putting *job*'s events on its queue.
+        """
+        start = time.perf_counter()
+        params = DEFAULTS | request
+        # File reads and the final decode run on threads, so other clients' events keep flowing meanwhile
+        if "path" in request:
+            data = await asyncio.to_thread(load_instance, request["path"])
+            name = os.path.basename(request["path"])
+        else:
+            data = np.asarray(request["instance"])
+            name = request.get("name", "instance")
+        # Not asserts, those are gone under python -O and the request would fail somewhere in a worker instead
+        if data.ndim != 2 or not np.all(data > 0):
+            raise ValueError("Instances are 2D matrices of positive times")
+        if params["decoder"] not in DECODERS or params["engine"] not in ENGINES:
+            raise ValueError("Unknown decoder or engine")
+
+        num_ga = params["num_ga"]
+        generations = params["generations"]
+        if generations is None:
+            generations = 100 if params["time_limit"] is None and params["evals"] is None else 1000
+        ga_params = (params["pop_size"], generations)
+        stop = {"stop_at_bound" : True, "time_limit" : params["time_limit"], "max_evals" : params["evals"]}
+        options = {"engine" : params["engine"], "stop" : stop, "decoder" : params["decoder"], "keep_instances" : self.instances.size}
+
+        loop = asyncio.get_running_loop()
+        key, inputs = self.instances.acquire(data)
+        try:
+            with SharedArrays(ga_outputs(num_ga, data.shape, generations)) as outputs:
+                job["stop_flags"] = outputs["stop_flags"]
+                try:
+                    specs = inputs.specs | outputs.specs
+
+                    async def run(slot: int) -> tuple[int, dict]:
+                        return slot, await loop.run_in_executor(self.executor, functools.partial(ga_process, ga_params, specs, slot, **options))
+
+                    crowd = Woc.streaming(data.shape)
+                    ga_results = []
+                    best = float('inf')
+                    for finished in asyncio.as_completed([run(slot) for slot in range(num_ga)]):
+                        slot, leftovers = await finished
+                        ga_results.append(leftovers)
+                        crowd.add_expert(outputs["schedules"][slot], outputs["makespans"][slot])
+                        best = min(best, float(outputs["makespans"][slot]))
+                        await job["events"].put({"event" : "progress",
+                                                 "completed" : len(ga_results),
+                                                 "num_ga" : num_ga,
+                                                 "best_ms" : best,
+                                                 "elapsed" : time.perf_counter() - start})
+
+                    async with self.decoding:
+                        # The shared copy, not a read-only memmap from load_instance, which the kernels would have to be specialized on
+                        Solution.data = inputs["data"]
+                        Solution.decoder = params["decoder"]
+                        line = await asyncio.to_thread(instance_result, name, inputs["data"], outputs, ga_results, crowd, with_schedule=True)
+                finally:
+                    # Even if something above failed: the client handler must not write to the flags once their block is closed
+                    job["stop_flags"] = None
+        finally:
+            self.instances.release(key)
+        await job["events"].put({"event" : "result", **line, "elapsed" : time.perf_counter() - start})
+
+
+def request(req: dict, path: str = "./ossp.sock", port: int = None) -> Iterator[dict]:
+    """
+    Sends *req* to the service at Unix socket *path* (or localhost *port*) and yields its events, ending with the result or error.
+    """
+    if port is not None:
+        sock = socket.create_connection(("127.0.0.1", port))
+    else:
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(path)
+    with sock, sock.makefile('rwb') as file:
+        file.write(json.dumps(req).encode() + b"\n")
+        file.flush()
+        for line in file:
+            event = json.loads(line)
+            yield event
+            if event["event"] != "progress":
+                return
+
+def serve(args: argparse.Namespace) -> int:
+    if args.port is None and os.path.exists(args.socket):
+        os.remove(args.socket)
+    service = SolverService(args.workers, args.cache, args.concurrent)
+    try:
+        asyncio.run(service.serve(args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def solve(args: argparse.Namespace) -> int:
+    req = {key : value for key, value in vars(args).items() if key in DEFAULTS and value is not None}
+    req["path"] = os.path.abspath(args.path)
+    for event in request(req, args.socket, args.port):
+        if event["event"] == "progress":
+            print(f"{event["completed"]}/{event["num_ga"]} GAs done, best {event["best_ms"]:.0f} ({event["elapsed"]:.3f}s)", file=sys.stderr)
+        else:
+            print(json.dumps(event))
+    return 0 if event["event"] == "result" else 1
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local GA + WOC solver service.")
+    parser.add_argument("--socket", default="./ossp.sock", help="Unix socket path")
+    parser.add_argument("--port", type=int, help="serve on localhost TCP instead of the socket")
+    subparsers = parser.add_subparsers(required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the service")
+    serve_parser.add_argument("--workers", type=int, default=ga_cores())
+    serve_parser.add_argument("--cache", type=int, default=32, help="instances kept in shared memory")
+    serve_parser.add_argument("--concurrent", type=int, default=2, help="requests solved at once, the rest wait in the queue")
+    serve_parser.set_defaults(func=serve)
+
+    solve_parser = subparsers.add_parser("solve", help="send one instance file to a running service")
+    solve_parser.add_argument("path")
+    solve_parser.add_argument("--time-limit", type=float)
+    solve_parser.add_argument("--evals", type=int)
+    solve_parser.add_argument("--generations", type=int)
+    solve_parser.add_argument("--num-ga", type=int)
+    solve_parser.add_argument("--pop-size", type=int)
+    solve_parser.add_argument("--engine", choices=list(ENGINES))
+    solve_parser.add_argument("--decoder", choices=list(DECODERS))
+    solve_parser.set_defaults(func=solve)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+'''
+Helpers for handing numpy arrays to worker processes through shared memory instead of pickling them.
+
+The parent creates a *SharedArrays* group and passes its *specs* (a few names and shapes) to workers,
+which *attach* to the same memory and read or write the arrays in place.
+'''
+
+# Arrays this process has attached to, by shared memory name, least recently used first. Kept so a worker attaches to each block only once.
+_attached = {}
+# Names of the attached blocks that were the "data" (instance) of some task
+_instances = set()
+
+class SharedArrays:
+    """
+    A named group of numpy arrays living in shared memory, owned (and eventually unlinked) by the process that created it.
+
+    Attributes:
+        arrays (dict):  key -> np.ndarray backed by shared memory
+        specs (dict):   key -> (shm name, shape, dtype str), small enough to send to workers with every task
+
+    """
+
+    def __init__(self, layout: dict[str, tuple[tuple, np.dtype]]):
+        """
+        Allocates one zeroed shared array per entry of *layout*, which maps key -> (shape, dtype).
+        """
+        self.blocks = {}
+        self.arrays = {}
+        self.specs = {}
+        for key, (shape, dtype) in layout.items():
+            dtype = np.dtype(dtype)
+            size = max(1, int(np.prod(shape)) * dtype.itemsize)
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            arr.fill(0)
+            self.blocks[key] = shm
+            self.arrays[key] = arr
+            self.specs[key] = (shm.name, tuple(shape), dtype.str)
+
+    @classmethod
+    def share(cls, **arrays: np.ndarray) -> "SharedArrays":
+        """
+        Returns a group holding shared copies of the given arrays.
+        """
+        group = cls({key : (arr.shape, arr.dtype) for key, arr in arrays.items()})
+        for key, arr in arrays.items():
+            group.arrays[key][...] = arr
+        return group
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def close(self) -> None:
+        """
+        Frees the shared memory. Arrays from this group must not be used afterwards.
+        """
+        self.arrays.clear()
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+        self.blocks.clear()
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach(specs: dict[str, tuple]) -> dict[str, np.ndarray]:
+    """
+    Returns key -> np.ndarray views of the shared arrays described by *specs* (from *SharedArrays.specs*).
+
+    Each block is only attached once per process; later calls reuse the same views.
+    """
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        if name not in _attached:
+            shm = shared_memory.SharedMemory(name=name)
+            _attached[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+        _attached[name] = _attached.pop(name)      # Now the most recently used
+        if key == "data":
+            _instances.add(name)
+        arrays[key] = _attached[name][1]
+    return arrays
+
+def detach_others(specs: dict[str, tuple], keep_instances: int = 0) -> None:
+    """
+    Drops this process's views of every shared array not described by *specs*, e.g. those of an instance a long-lived worker is done with.
+    Views of the *keep_instances* most recently used other instances (blocks attached as "data") are kept too.
+
+    Nothing may still reference the dropped views.
+    """
+    keep = {name for name, _, _ in specs.values()}
+    recent = [name for name in _attached if name in _instances and name not in keep]
+    if keep_instances > 0:
+        keep.update(recent[-keep_instances:])
+    for name in list(_attached):
+        if name not in keep:
+            shm, arr = _attached.pop(name)
+            _instances.discard(name)
+            del arr
+            shm.close()
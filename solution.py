@@ -1,59 +1,119 @@
 from __future__ import annotations
 import numpy as np
+import heapq
 import bisect
-import matplotlib.pyplot as plt
+import random
+import functools
+import hashlib
+from collections import OrderedDict
+from instrument import metrics
+from instances import fit_dtype
+import backend
 
 class Solution:
     """
     Object to represent a single solution.
 
+    Instances are kept small, since populations of them are built in every worker and pickled back to the parent:
+    they have no per-instance __dict__, the schedule is stored in the smallest integer dtype that holds a job index,
+    and start times (integer for integer data) are only decoded when something asks for them.
+
     Attributes:
         schedule (2D np array):         schedule[i, j] is the jth job of the ith machine
-        starts (2D np array):           starts[i, j] is the starting time of the jth job of ith machine
+        starts (2D np array):           starts[i, j] is the starting time of the jth job of ith machine. Decoded on first access
         makespan (float):               total time of solution. Needs to be recalculated if the solution object's schedule changes
 
         data (static, 2D np array):     data[i, j] is the time-length of the jth job on the ith machine
         cross_rate (static, float):     0 <= rate <= 1, denotes frequency of crossover operation
         mutate_rate (static, float):    0 <= rate <= 1, denotes frequency of mutate operation
+        cache (static, FitnessCache):   if set, decoded schedules are memoized in it. Off (None) by default
+        evaluations (static, int):      schedules decoded so far in this process, full or incremental (cache hits don't count)
+        decoder (static, str):          how schedules are turned into start times, a key of DECODERS. "insertion" by default
 
     """
 
+    __slots__ = ("schedule", "_starts", "makespan")
+
     data = None
     cross_rate = 0.75
     mutate_rate = 0.02
+    cache = None
+    evaluations = 0
+    decoder = "insertion"
 
-    def __init__(self, schedule: np.ndarray=None):
+    def __init__(self, schedule: np.ndarray=None, starts: np.ndarray=None):
         """
         If *schedule* is given, associates a valid solution with start times.
+        If *starts* is given too (e.g. from *make_starts_batch*), it is trusted and not recomputed.
 
         Otherwise, creates a random solution.
+
+        Without *starts*, only the makespan is worked out and the start times are left for the *starts* property to decode.
         """
         assert self.data is not None, "Initialize Solution.data before instantiating Solution objects"
+        sched_dtype, starts_dtype = compact_dtypes()
 
         if schedule is None:
             # Create random solution
-            self.schedule = random_schedule(self.data.shape)
-            self.starts = make_starts(self.schedule)
+            schedule = random_schedule(self.data.shape)
+        self.schedule = schedule.astype(sched_dtype, copy=False)
+
+        if starts is not None:
+            self._starts = starts.astype(starts_dtype, copy=False)
+            self.makespan = self.calc_makespan()
+        elif Solution.cache is not None:
+            # Cached entries hold starts, so go through them
+            self._starts = decode(self.schedule)
+            self.makespan = self.calc_makespan()
         else:
-            # Assign starts to given schedule
-            self.schedule = schedule
-            self.starts = make_starts(schedule)
+            self._starts = None
+            self.makespan = DECODERS[Solution.decoder][1](self.schedule)
+
+    @property
+    def starts(self) -> np.ndarray:
+        if self._starts is None:
+            self._starts = decode(self.schedule)
+        return self._starts
+
+    def changed(self, schedule: np.ndarray, from_col: int) -> Solution:
+        """
+        Returns a new solution for *schedule*, which must agree with this one on every column before *from_col*.
+
+        Only columns from *from_col* onward are decoded again; the earlier start times are reused.
+        That only works for the "insertion" decoder, the others decode *schedule* from scratch.
+        So does a solution whose starts haven't been decoded yet, since decoding them first would cost two decodes instead of one.
+        """
+        if Solution.decoder != "insertion" or self._starts is None:
+            return Solution(schedule)
+
+        cache = Solution.cache
+        starts = cache.get(schedule) if cache is not None else None
+        if starts is None:
+            starts = make_starts(schedule, self.starts, from_col)
+            if cache is not None:
+                cache.put(schedule, starts)
+        return Solution(schedule, starts)
+
+    def swap(self, machine: int, job1: int, job2: int) -> Solution:
+        """
+        Returns a new solution with the jobs at positions *job1* and *job2* of *machine* swapped, evaluated incrementally.
+        """
+        new_schedule = np.copy(self.schedule)
+        new_schedule[machine, job1], new_schedule[machine, job2] = self.schedule[machine, job2], self.schedule[machine, job1]
+        return self.changed(new_schedule, min(job1, job2))
 
-        self.makespan = self.calc_makespan()
-    
     def job_times(self) -> np.ndarray:
         """
         Returns array of finishing times for each machine.
+
+        Taken over the whole row, since decoders other than "insertion" don't run a machine's jobs in schedule order.
         """
 
         if np.isin(-1, self.schedule) or np.isin(-1, self.starts) or self.data is None:
             return None
         
-        res = np.empty(self.schedule.shape[0])
-        for i in range(len(res)):
-            res[i] = self.starts[i, -1] + self.data[i, self.schedule[i, -1]]
-        
-        return res
+        ends = self.starts + self.data[np.arange(self.schedule.shape[0])[:, None], self.schedule]
+        return np.max(ends, axis=1)
 
     def calc_makespan(self) -> float:
         """
@@ -64,9 +124,38 @@ class Solution:
             return -1
         else:
             ms = np.max(jt)
-            return ms
+            return float(ms)
 
 
+def lower_bound(data: np.ndarray) -> float:
+    """
+    Returns a lower bound on the makespan of any schedule for *data*: no machine can finish before its total load,
+    and no job before its total processing time.
+    """
+    return max(np.max(np.sum(data, axis=1)), np.max(np.sum(data, axis=0)))
+
+
+# (Solution.data, its (schedule dtype, starts dtype)) of the last *compact_dtypes* call
+_dtypes = (None, None)
+
+def compact_dtypes() -> tuple[np.dtype, np.dtype]:
+    """
+    Returns the dtypes solutions for Solution.data are stored in: the smallest integer type holding every job index for schedules,
+    and for start times the smallest integer type holding the sum of all times (no start can be later), or float64 if the data isn't integer.
+    """
+    global _dtypes
+    data, dtypes = _dtypes
+    if data is not Solution.data:
+        data = Solution.data
+        sched_dtype = fit_dtype(data.shape[1] - 1)
+        if np.issubdtype(data.dtype, np.integer):
+            starts_dtype = fit_dtype(int(np.sum(data, dtype=np.int64)))
+        else:
+            starts_dtype = np.dtype(np.float64)
+        dtypes = (sched_dtype, starts_dtype)
+        _dtypes = (data, dtypes)
+    return dtypes
+
 def random_schedule(shape: tuple[int, int]) -> np.ndarray:
     """
     Returns a random schedule given *shape* = (num_machines, num_jobs).
@@ -75,37 +164,669 @@ def random_schedule(shape: tuple[int, int]) -> np.ndarray:
     return np.array([np.random.permutation(num_jobs) for _ in range(num_machines)])
 
 
-def make_starts(schedule: np.ndarray) -> np.ndarray:
+def random_schedules(count: int, shape: tuple[int, int]) -> np.ndarray:
+    """
+    Returns a (*count*, num_machines, num_jobs) stack of random schedules, in the smallest dtype holding a job index.
+
+    Drawn one schedule at a time, which takes the same random numbers as one batched draw, but keeps the float keys and
+    argsort indices to a single schedule's worth on large instances.
+    """
+    num_machines, num_jobs = shape
+    schedules = np.empty((count, num_machines, num_jobs), dtype=fit_dtype(num_jobs - 1))
+    for schedule in schedules:
+        schedule[...] = np.argsort(np.random.random((num_machines, num_jobs)), axis=-1)
+    return schedules
+
+
+@metrics.timed("make_starts")
+def make_starts(schedule: np.ndarray, prev_starts: np.ndarray = None, from_col: int = 0) -> np.ndarray:
     """
     Returns a valid starts array corresponding to given schedule
+
+    If *prev_starts* is given, columns before *from_col* are taken from it instead of being decoded again.
+    It must come from a schedule that agrees with *schedule* on every column before *from_col*.
     """
     assert Solution.data is not None, "Need to initialize Solution.data before make_starts can run."
     assert schedule is not None, "make_starts called with None schedule! This is a problem I'm afraid."
+    metrics.count("decodes")
+    Solution.evaluations += 1
 
-    shape = schedule.shape
-    starts = np.empty(shape)
-    jobs_busy = [[] for _ in range(shape[1])]     # jobs_busy[i] gives list of (start, end) times where the ith job is busy
-    for col in range(shape[1]):
-        for row in range(shape[0]):
+    if backend.ENABLED:
+        starts = np.zeros(schedule.shape)
+        if from_col > 0:
+            starts[:, :from_col] = prev_starts[:, :from_col]
+        backend.decode_starts(schedule, np.asarray(Solution.data), starts, from_col)
+        return starts.astype(compact_dtypes()[1])
+
+    num_machines, num_jobs = schedule.shape
+    # Plain lists index much faster than numpy scalars in this loop
+    sched = schedule.tolist()
+    data = Solution.data.tolist()
+    intervals = busy_intervals_class(schedule)
+    if from_col > 0:
+        # The decoder only looks back, so the busy intervals of the kept columns are all the state it needs
+        starts = prev_starts.tolist()
+        jobs_busy = intervals.from_columns(schedule, prev_starts, from_col)
+    else:
+        starts = [[0.0] * num_jobs for _ in range(num_machines)]
+        jobs_busy = [intervals() for _ in range(num_jobs)]     # jobs_busy[i] holds the (start, end) times where the ith job is busy
+    for col in range(from_col, num_jobs):
+        for row in range(num_machines):
             if col != 0:
-                prev_job_ind = (row, col-1)
-                prev_job = schedule[prev_job_ind]
-                after = starts[prev_job_ind] + Solution.data[row, prev_job]
+                prev_job = sched[row][col-1]
+                after = starts[row][col-1] + data[row][prev_job]
             else:
                 after = 0
-            job = schedule[row, col]
-            length = Solution.data[row, job]
-            start = insert_job(after, jobs_busy[job], length)
-            starts[row, col] = start
-            bisect.insort(jobs_busy[job], (start, start + length), key=lambda x: x[0])
+            job = sched[row][col]
+            length = data[row][job]
+            busy = jobs_busy[job]
+            start = busy.earliest(after, length)
+            starts[row][col] = start
+            busy.insert(start, start + length)
+
+    return np.array(starts, dtype=compact_dtypes()[1])
+
+@metrics.timed("make_makespan")
+def make_makespan(schedule: np.ndarray) -> float:
+    """
+    Returns the makespan *make_starts* would give *schedule*, without building a starts array:
+    only the current end time of every machine is kept while decoding.
+    """
+    assert Solution.data is not None, "Need to initialize Solution.data before make_makespan can run."
+    metrics.count("decodes")
+    Solution.evaluations += 1
+    if backend.ENABLED:
+        return float(backend.decode_makespan(schedule, np.asarray(Solution.data)))
+
+    num_machines, num_jobs = schedule.shape
+    sched = schedule.tolist()
+    data = Solution.data.tolist()
+    ends = [0] * num_machines
+    intervals = busy_intervals_class(schedule)
+    jobs_busy = [intervals() for _ in range(num_jobs)]
+    for col in range(num_jobs):
+        for row in range(num_machines):
+            job = sched[row][col]
+            length = data[row][job]
+            busy = jobs_busy[job]
+            start = busy.earliest(ends[row], length)
+            ends[row] = start + length
+            busy.insert(start, ends[row])
+
+    return float(max(ends))
+
+class BusyIntervals:
+    """
+    Busy intervals of a single job, kept sorted, with the free gaps between them.
+
+    Finding a gap binary searches past everything that has ended, then scans the gaps from there, and inserting shifts the lists,
+    so both take O(n) steps for n intervals. That beats *IntervalTree* as long as n stays in the low thousands, i.e. on every
+    instance with up to *TREE_MIN_INTERVALS* machines.
+
+    Attributes:
+        starts (list):  sorted start times of the intervals
+        ends (list):    ends[i] is the end time of the interval starting at starts[i] (also sorted, since intervals never overlap)
+        gaps (list):    gaps[i] is the free time between ends[i] and starts[i+1]
+
+    """
+
+    __slots__ = ("starts", "ends", "gaps")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.gaps = []
+
+    @classmethod
+    def from_columns(cls, schedule: np.ndarray, starts: np.ndarray, num_cols: int) -> list[BusyIntervals]:
+        """
+        Returns the per-job intervals *make_starts* has built after decoding the first *num_cols* columns of *schedule* into *starts*,
+        without searching for any gaps.
+        """
+        num_machines, num_jobs = schedule.shape
+        jobs = schedule[:, :num_cols]
+        kept_starts = starts[:, :num_cols]
+        kept_ends = kept_starts + Solution.data[np.arange(num_machines)[:, None], jobs]
+
+        # Group intervals by job, sorted by start within each job
+        order = np.lexsort((kept_starts.ravel(), jobs.ravel()))
+        all_starts = kept_starts.ravel()[order].tolist()
+        all_ends = kept_ends.ravel()[order].tolist()
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(jobs.ravel(), minlength=num_jobs)))).tolist()
+        return [cls.from_sorted(all_starts[lo:hi], all_ends[lo:hi]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    @classmethod
+    def from_sorted(cls, starts: list, ends: list) -> BusyIntervals:
+        """
+        Returns the intervals with the given *starts* and *ends*, already sorted.
+        """
+        busy = cls()
+        busy.starts, busy.ends = starts, ends
+        busy.gaps = [start - end for start, end in zip(starts[1:], ends[:-1])]
+        return busy
+
+    def earliest(self, after: float, length: float) -> float:
+        """
+        Returns the earliest time at or after *after* where an interval of *length* fits.
+
+        Gives the same answer as *insert_job*, but binary searches past everything that ends before *after*
+        and skips the scan when no gap from there on is long enough.
+        """
+        ends = self.ends
+        i = bisect.bisect_left(ends, after)
+        # Everything before i has ended, so the gap in front of interval i opens at *after*
+        if i == len(ends) or self.starts[i] - length >= after:
+            return after
+
+        gaps = self.gaps
+        if i < len(gaps) and max(gaps[i:]) >= length:
+            for j in range(i, len(gaps)):
+                if gaps[j] >= length:
+                    return ends[j]
+
+        # Doesn't fit in gaps
+        return ends[-1]
+
+    def insert(self, start: float, end: float) -> None:
+        """
+        Adds the busy interval (*start*, *end*), which must not overlap any existing one.
+        """
+        starts, ends = self.starts, self.ends
+        pos = bisect.bisect_left(starts, start)
+        starts.insert(pos, start)
+        ends.insert(pos, end)
+
+        # The gap that used to span pos is split in two around the new interval
+        new_gaps = []
+        if pos > 0:
+            new_gaps.append(start - ends[pos-1])
+        if pos + 1 < len(starts):
+            new_gaps.append(starts[pos+1] - end)
+        self.gaps[max(pos-1, 0):pos] = new_gaps
+
+# Treap priorities of *IntervalTree* nodes. Only the tree's shape depends on them, so they come from their own generator,
+# never from the GA's random streams.
+_priorities = random.Random(0)
+
+class IntervalTree(BusyIntervals):
+    """
+    *BusyIntervals* as a treap ordered by start time, with an index of the free gaps between them.
+
+    Every node is one interval, numbered in insertion order. Besides its times, a node keeps the gap to the next interval
+    and the longest gap in its subtree, so *earliest* and *insert* take O(log n) expected steps instead of scanning every interval.
+    The bookkeeping only pays off for jobs with thousands of intervals, so *make_starts* only uses it past *TREE_MIN_INTERVALS*.
+
+    Attributes:
+        starts (list):      starts[i] is the start time of interval i, in insertion order rather than sorted
+        ends (list):        ends[i] is its end time
+        gaps (list):        gaps[i] is the free time between ends[i] and the start of the next interval (inf for the last one)
+        max_gaps (list):    max_gaps[i] is the longest gap in the subtree of node i
+        left (list):        left[i], right[i] are node i's children, -1 if none
+        right (list):
+        prios (list):       treap priorities, every parent's higher than its children's
+        root (int):         root node, -1 while there are no intervals
+
+    """
+
+    __slots__ = ("max_gaps", "left", "right", "prios", "root")
+
+    def __init__(self):
+        super().__init__()
+        self.max_gaps = []
+        self.left = []
+        self.right = []
+        self.prios = []
+        self.root = -1
+
+    @classmethod
+    def from_sorted(cls, starts: list, ends: list) -> IntervalTree:
+        """
+        Returns the intervals with the given *starts* and *ends*, already sorted, built in linear time.
+        """
+        busy = cls()
+        n = len(starts)
+        busy.starts, busy.ends = starts, ends
+        busy.gaps = [start - end for start, end in zip(starts[1:], ends[:-1])] + [float('inf')] * min(n, 1)
+        busy.prios = prios = [_priorities.random() for _ in range(n)]
+        busy.left = left = [-1] * n
+        busy.right = right = [-1] * n
+
+        # Cartesian tree on the priorities: the right spine is on the stack, and each new node takes what it outranks as its left subtree
+        spine = []
+        for node in range(n):
+            last = -1
+            while spine and prios[spine[-1]] < prios[node]:
+                last = spine.pop()
+            left[node] = last
+            if spine:
+                right[spine[-1]] = node
+            spine.append(node)
+        busy.root = spine[0] if spine else -1
+
+        # Subtree maxima, children before parents
+        busy.max_gaps = list(busy.gaps)
+        order = [busy.root] if n else []
+        for node in order:
+            order += [child for child in (left[node], right[node]) if child >= 0]
+        for node in reversed(order):
+            busy._update(node)
+        return busy
+
+    def _update(self, node: int) -> None:
+        max_gaps = self.max_gaps
+        longest = self.gaps[node]
+        for child in (self.left[node], self.right[node]):
+            if child >= 0 and max_gaps[child] > longest:
+                longest = max_gaps[child]
+        max_gaps[node] = longest
+
+    def earliest(self, after: float, length: float) -> float:
+        """
+        Returns the earliest time at or after *after* where an interval of *length* fits.
+
+        Gives the same answer as *insert_job*: the gap in front of the first interval that ends at or after *after*,
+        if it fits, otherwise the first long enough gap past that interval, found through the subtree maxima.
+        """
+        starts, ends, gaps, max_gaps, left, right = self.starts, self.ends, self.gaps, self.max_gaps, self.left, self.right
+
+        # The intervals ending at or after *after* are, in order: each node where the search for *after* goes left, then its right subtree,
+        # deepest node first
+        suffix = []
+        node = self.root
+        while node >= 0:
+            if ends[node] >= after:
+                suffix.append(node)
+                node = left[node]
+            else:
+                node = right[node]
+        # Everything before the first of them has ended, so the gap in front of it opens at *after*
+        if not suffix or starts[suffix[-1]] - length >= after:
+            return after
+
+        for node in reversed(suffix):
+            if gaps[node] >= length:
+                return ends[node]
+            sub = right[node]
+            if sub >= 0 and max_gaps[sub] >= length:
+                # Leftmost long enough gap in this subtree
+                while True:
+                    child = left[sub]
+                    if child >= 0 and max_gaps[child] >= length:
+                        sub = child
+                    elif gaps[sub] >= length:
+                        return ends[sub]
+                    else:
+                        sub = right[sub]
+        # The last gap is unbounded, so the loop always returns
+        raise AssertionError("Gap index out of sync with the intervals")
+
+    def insert(self, start: float, end: float) -> None:
+        """
+        Adds the busy interval (*start*, *end*), which must not overlap any existing one. Goes in front of any interval starting at *start* too.
+        """
+        starts, ends, gaps, left, right, prios = self.starts, self.ends, self.gaps, self.left, self.right, self.prios
+        node = len(starts)
+        prio = _priorities.random()
+        starts.append(start)
+        ends.append(end)
+        gaps.append(float('inf'))
+        self.max_gaps.append(float('inf'))
+        left.append(-1)
+        right.append(-1)
+        prios.append(prio)
+
+        # Walk down to where the new node's priority puts it, then split what hangs there into its left (earlier) and right (later) subtrees.
+        # Every subtree that changes, and the new node's predecessor, is on these two paths.
+        pred = succ = -1
+        path = []
+        cur = self.root
+        while cur >= 0 and prios[cur] > prio:
+            path.append(cur)
+            if starts[cur] < start:
+                pred, cur = cur, right[cur]
+            else:
+                succ, cur = cur, left[cur]
+        if not path:
+            self.root = node
+        elif starts[path[-1]] < start:
+            right[path[-1]] = node
+        else:
+            left[path[-1]] = node
+
+        split = []
+        left_hook, right_hook = (left, node), (right, node)
+        while cur >= 0:
+            split.append(cur)
+            if starts[cur] < start:
+                left_hook[0][left_hook[1]] = cur
+                left_hook = (right, cur)
+                pred, cur = cur, right[cur]
+            else:
+                right_hook[0][right_hook[1]] = cur
+                right_hook = (left, cur)
+                succ, cur = cur, left[cur]
+        left_hook[0][left_hook[1]] = -1
+        right_hook[0][right_hook[1]] = -1
+
+        if succ >= 0:
+            gaps[node] = starts[succ] - end
+        if pred >= 0:
+            gaps[pred] = start - ends[pred]
+        # Same as *_update* on every changed node, children first, inlined since it's most of the work
+        max_gaps = self.max_gaps
+        split.reverse()
+        path.reverse()
+        for changed in split + [node] + path:
+            longest = gaps[changed]
+            child = left[changed]
+            if child >= 0 and max_gaps[child] > longest:
+                longest = max_gaps[child]
+            child = right[changed]
+            if child >= 0 and max_gaps[child] > longest:
+                longest = max_gaps[child]
+            max_gaps[changed] = longest
+
+# Jobs with more operations than this get an *IntervalTree* in the pure Python decoder. Shifting plain lists happens in C,
+# so it holds out much longer than the compiled version of it does (see backend.TREE_MIN_INTERVALS): on instances with 20 jobs,
+# decoding 2000 machines took 162 ms flat and 235 ms with trees, 8000 machines 1.7 s flat and 1.2 s with trees.
+TREE_MIN_INTERVALS = 4096
+
+def busy_intervals_class(schedule: np.ndarray) -> type[BusyIntervals]:
+    """
+    Returns the class *make_starts* keeps each job's busy intervals in for *schedule*: *IntervalTree* once some job
+    has more than *TREE_MIN_INTERVALS* operations, plain *BusyIntervals* otherwise.
+    """
+    if np.bincount(schedule.ravel()).max() > TREE_MIN_INTERVALS:
+        return IntervalTree
+    return BusyIntervals
+
+# Most schedule cells *make_starts_batch* decodes at once, which bounds its float scratch space (and the busy interval arrays without the backend)
+BATCH_CELLS = 2**22
+
+@metrics.timed("make_starts_batch")
+def make_starts_batch(schedules: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decodes a whole stack of schedules at once.
+
+    *schedules* has shape (P, M, N). Returns (starts, makespans) with shapes (P, M, N) and (P,),
+    giving exactly what *make_starts* and *Solution.calc_makespan* give for each schedule on its own.
+
+    Cells are still visited in the same column-by-column order, but every cell is placed for all P schedules in one go.
+    Large stacks are decoded in chunks of at most BATCH_CELLS cells.
+    """
+    assert Solution.data is not None, "Need to initialize Solution.data before make_starts_batch can run."
+
+    schedules = np.asarray(schedules)
+    pop, num_machines, num_jobs = schedules.shape
+    metrics.count("decodes", pop)
+    Solution.evaluations += pop
+
+    starts = np.empty(schedules.shape, dtype=compact_dtypes()[1])
+    chunk = max(1, BATCH_CELLS // (num_machines * num_jobs))
+    for lo in range(0, pop, chunk):
+        starts[lo:lo+chunk] = _starts_batch(schedules[lo:lo+chunk])
+    return starts, batch_makespans(schedules, starts)
+
+def _starts_batch(schedules: np.ndarray) -> np.ndarray:
+    # Float starts of one chunk of *make_starts_batch*
+    data = Solution.data
+    pop, num_machines, num_jobs = schedules.shape
+    pop_inds = np.arange(pop)
+
+    starts = np.empty(schedules.shape)
+    if backend.ENABLED:
+        backend.decode_starts_batch(schedules, np.asarray(data), starts)
+        return starts
+
+    # busy_starts[p, job], busy_ends[p, job] are the intervals placed so far for *job* in the pth schedule, sorted by start.
+    # Unused slots are inf, so every gap past the last interval is unbounded.
+    # There's room for every occurrence of the most frequent job: M for proper schedules, but aggregates can repeat a job within a row.
+    occurrences = np.bincount((pop_inds[:, None, None] * num_jobs + schedules).ravel(), minlength=pop * num_jobs)
+    capacity = max(1, int(occurrences.max()))
+    busy_starts = np.full((pop, num_jobs, capacity), np.inf)
+    busy_ends = np.full((pop, num_jobs, capacity), np.inf)
+    no_end = np.full((pop, 1), -np.inf)
+    no_start = np.full((pop, 1), np.inf)
+    slots = np.arange(capacity)
+    after = np.zeros(pop)
+
+    for col in range(num_jobs):
+        for row in range(num_machines):
+            if col != 0:
+                prev_job = schedules[:, row, col-1]
+                after = starts[:, row, col-1] + data[row, prev_job]
+            job = schedules[:, row, col]
+            length = data[row, job]
+
+            # Gap k runs from the end of interval k-1 to the start of interval k, same as insert_job walks them
+            job_starts = busy_starts[pop_inds, job]
+            job_ends = busy_ends[pop_inds, job]
+            gap_starts = np.concatenate((job_starts, no_start), axis=1)
+            cands = np.maximum(after[:, None], np.concatenate((no_end, job_ends), axis=1))
+            fits = gap_starts >= cands + length[:, None]
+            start = np.where(fits, cands, np.inf).min(axis=1)
+            starts[:, row, col] = start
+
+            # Insert (start, start + length) into the sorted slots, shifting later intervals right
+            pos = np.sum(job_starts < start[:, None], axis=1)[:, None]
+            before, at = slots < pos, slots == pos
+            busy_starts[pop_inds, job] = np.where(before, job_starts, np.where(at, start[:, None], np.roll(job_starts, 1, axis=1)))
+            busy_ends[pop_inds, job] = np.where(before, job_ends, np.where(at, (start + length)[:, None], np.roll(job_ends, 1, axis=1)))
 
     return starts
 
+def batch_makespans(schedules: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Returns the makespan of every schedule in the (P, M, N) stack *schedules*, given its matching *starts*.
+    """
+    num_machines = schedules.shape[1]
+    ends = starts + Solution.data[np.arange(num_machines)[:, None], schedules]
+    return np.max(ends, axis=(1, 2))
+
+@metrics.timed("dispatch")
+def dispatch(schedule: np.ndarray, active: bool, with_starts: bool = True) -> np.ndarray | float:
+    """
+    Alternative decoder: a schedule generator that reads *schedule* as job priorities instead of a job order.
+    The earlier a job is in a machine's row, the sooner that machine wants it.
+
+    Machines take turns in order of when they come free, kept in a heap. The machine up next at time t takes
+        - non-delay (not *active*): its most wanted job that is free at t. If none is, it idles until its first job frees up.
+        - *active*: its most wanted job that can start before any of its jobs could finish, even if that means idling a bit
+          (the Giffler-Thompson conflict set, looked at from the machine's side).
+    Every step is a heap operation plus one scan of the machine's remaining jobs, so O(M·N·(N + log M)) overall, with no gap search.
+
+    Returns the starts array, laid out like *schedule* (starts[i, j] is when job schedule[i, j] starts on machine i),
+    or only the makespan if not *with_starts*.
+    """
+    assert Solution.data is not None, "Need to initialize Solution.data before dispatch can run."
+    metrics.count("decodes")
+    Solution.evaluations += 1
+    if backend.ENABLED:
+        starts = np.zeros(schedule.shape) if with_starts else np.empty((0, 0))
+        makespan = backend.dispatch(schedule, np.asarray(Solution.data), active, starts)
+        return starts.astype(compact_dtypes()[1]) if with_starts else float(makespan)
+
+    num_machines, num_jobs = schedule.shape
+    sched = schedule.tolist()
+    data = Solution.data.tolist()
+    remaining = [list(range(num_jobs)) for _ in range(num_machines)]    # remaining[i] holds row i's unscheduled positions, most wanted first
+    job_ready = [0] * num_jobs
+    starts = [[0] * num_jobs for _ in range(num_machines)]
+    makespan = 0
+    machines = [(0, machine) for machine in range(num_machines)]          # (time it comes free, machine), already a heap
+
+    while machines:
+        t, machine = heapq.heappop(machines)
+        row, times, left = sched[machine], data[machine], remaining[machine]
+        if active:
+            finish = min(max(t, job_ready[row[pos]]) + times[row[pos]] for pos in left)
+            pick = next(i for i, pos in enumerate(left) if max(t, job_ready[row[pos]]) < finish)
+        else:
+            pick = next((i for i, pos in enumerate(left) if job_ready[row[pos]] <= t), None)
+            if pick is None:
+                heapq.heappush(machines, (min(job_ready[row[pos]] for pos in left), machine))
+                continue
+
+        pos = left.pop(pick)
+        job = row[pos]
+        start = max(t, job_ready[job])
+        end = start + times[job]
+        starts[machine][pos] = start
+        job_ready[job] = end
+        makespan = max(makespan, end)
+        if left:
+            heapq.heappush(machines, (end, machine))
+
+    if not with_starts:
+        return float(makespan)
+    return np.array(starts, dtype=compact_dtypes()[1])
+
+# Decoder name -> (function returning starts, function returning only the makespan), selected by *Solution.decoder*
+DECODERS = {"insertion" : (make_starts, make_makespan),
+            "active" : (functools.partial(dispatch, active=True), functools.partial(dispatch, active=True, with_starts=False)),
+            "nondelay" : (functools.partial(dispatch, active=False), functools.partial(dispatch, active=False, with_starts=False))}
+
+def make_solutions(schedules: np.ndarray) -> list[Solution]:
+    """
+    Returns a *Solution* for every schedule in the (P, M, N) stack *schedules*, decoded in one *decode_batch* call.
+    """
+    starts, _ = decode_batch(schedules)
+    return [Solution(schedule, sched_starts) for schedule, sched_starts in zip(schedules, starts)]
+
+def decode(schedule: np.ndarray) -> np.ndarray:
+    """
+    Decodes *schedule* with the decoder named by *Solution.decoder*, going through *Solution.cache* when it is set.
+    """
+    make = DECODERS[Solution.decoder][0]
+    cache = Solution.cache
+    if cache is None:
+        return make(schedule)
+
+    starts = cache.get(schedule)
+    if starts is None:
+        starts = make(schedule)
+        cache.put(schedule, starts)
+    return starts
+
+def decode_batch(schedules: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    *make_starts_batch*, going through *Solution.cache* when it is set. Only the schedules missing from the cache are decoded.
+
+    Decoders other than "insertion" have no batched version, so they decode one schedule at a time.
+    """
+    if Solution.decoder != "insertion":
+        starts = np.array([decode(schedule) for schedule in schedules])
+        return starts, batch_makespans(np.asarray(schedules), starts)
+
+    cache = Solution.cache
+    if cache is None:
+        return make_starts_batch(schedules)
+
+    schedules = np.asarray(schedules)
+    starts = np.empty(schedules.shape, dtype=compact_dtypes()[1])
+    missing = []
+    for i, schedule in enumerate(schedules):
+        cached = cache.get(schedule)
+        if cached is None:
+            missing.append(i)
+        else:
+            starts[i] = cached
+
+    if missing:
+        new_starts, _ = make_starts_batch(schedules[missing])
+        starts[missing] = new_starts
+        for i, sched_starts in zip(missing, new_starts):
+            cache.put(schedules[i], sched_starts)
+
+    return starts, batch_makespans(schedules, starts)
+
+class FitnessCache:
+    """
+    Size-bounded LRU cache of decoded start times, keyed by a hash of the schedule's bytes.
+
+    Entries are only valid for the *Solution.data* and *Solution.decoder* they were decoded with, so the cache empties itself when either changes.
+
+    Attributes:
+        maxsize (int):      most entries kept before the least recently used one is evicted
+        hits (int):         lookups answered from the cache
+        misses (int):       lookups that had to be decoded (one *make_starts* call saved per hit)
+        evictions (int):    entries dropped to stay under *maxsize*
+
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        assert maxsize >= 1, "FitnessCache needs room for at least one entry."
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.data = Solution.data
+        self.decoder = Solution.decoder
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(schedule: np.ndarray) -> bytes:
+        """
+        Returns the cache key of *schedule*.
+        """
+        schedule = np.ascontiguousarray(schedule)
+        return hashlib.blake2b(schedule.tobytes(), digest_size=16, person=schedule.dtype.str.encode()).digest()
+
+    def get(self, schedule: np.ndarray) -> np.ndarray:
+        """
+        Returns the cached starts of *schedule*, or None if it isn't cached.
+        """
+        if self.data is not Solution.data or self.decoder != Solution.decoder:
+            self.entries.clear()
+            self.data = Solution.data
+            self.decoder = Solution.decoder
+
+        key = self.key(schedule)
+        starts = self.entries.get(key)
+        if starts is None:
+            self.misses += 1
+            metrics.count("cache_misses")
+        else:
+            self.hits += 1
+            metrics.count("cache_hits")
+            self.entries.move_to_end(key)
+        return starts
+
+    def put(self, schedule: np.ndarray, starts: np.ndarray) -> None:
+        """
+        Caches *starts* as the decoding of *schedule*, evicting the least recently used entry if full.
+        """
+        self.entries[self.key(schedule)] = np.copy(starts)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns a dictionary of hit statistics.
+        """
+        lookups = self.hits + self.misses
+        return {"hits" : self.hits,
+                "misses" : self.misses,
+                "evictions" : self.evictions,
+                "size" : len(self.entries),
+                "hit_rate" : self.hits / lookups if lookups else 0.0}
+
+    @staticmethod
+    def merge_stats(all_stats: list[dict]) -> dict:
+        """
+        Combines several *stats* dictionaries (e.g. from different GA runs) into one.
+        """
+        merged = {stat : sum(stats[stat] for stats in all_stats) for stat in ("hits", "misses", "evictions", "size")}
+        lookups = merged["hits"] + merged["misses"]
+        merged["hit_rate"] = merged["hits"] / lookups if lookups else 0.0
+        return merged
+
 def insert_job(after: float, job_starts: list, length: float) -> float:
     """
     Returns the best starting time for a job that takes *length* time, inserted after *after*, with the given list *job_starts* of busyness for the job.
 
-    Used in *make_starts*.
+    Reference version of *BusyIntervals.earliest*, which *make_starts* uses instead.
     """
     if not job_starts:
         return after
@@ -132,40 +853,62 @@ def insert_job(after: float, job_starts: list, length: float) -> float:
     # Doesn't fit in gaps
     return max(after, job_starts[-1][1])
 
-def plot_solution(solution: Solution, xlim : int = None, title : str = "", save_path : str = None):
+@metrics.timed("plot")
+def plot_solution(solution: Solution, xlim : int = None, title : str = "", save_path : str = None, label_limit : int = 400,
+                  max_machines : int = 100):
     """
     Takes a solution and plots it.
 
+    All bars go into a single PolyCollection. Job labels are only drawn for at most *label_limit* operations,
+    since each one is its own artist and past that they don't fit in the bars anyway.
+    Instances with more than *max_machines* machines are downsampled to that many evenly spaced ones, which the title says.
+
     If *save_path* is given as a nonempty string, will save plot in "./output/solution_plots/" under *save_path*.png.
 
     """
+    # Imported here, so solving never pays for matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PolyCollection
+
     sched = solution.schedule
     starts = solution.starts
     data = solution.data
     num_machines, num_jobs = sched.shape
+    shown = np.arange(num_machines)
+    if num_machines > max_machines:
+        shown = np.unique(np.linspace(0, num_machines - 1, max_machines).round().astype(int))
+        title = f"{title}, " if title else ""
+        title += f"{len(shown)} of {num_machines} machines"
 
-    # Change tab10 to tab20 or hsv if more than 10 jobs
-    colors = plt.cm.get_cmap("tab10", num_jobs)
-    
-    fig, ax = plt.subplots(figsize=(10,6))
-    for machine in range(num_machines):
-        for job_index in range(num_jobs):
-            job = sched[machine, job_index]
-            start_time = starts[machine, job_index]
-            duration = data[machine, job]
+    # One rectangle per operation, row by row (rows numbered among the shown machines)
+    machines = np.repeat(np.arange(len(shown)), num_jobs)
+    jobs = sched[shown].ravel()
+    lefts = starts[shown].ravel().astype(float)
+    rights = lefts + data[shown[machines], jobs]
+    bottoms, tops = machines - 0.4, machines + 0.4
+    verts = np.stack((np.column_stack((lefts, bottoms)), np.column_stack((lefts, tops)),
+                      np.column_stack((rights, tops)), np.column_stack((rights, bottoms))), axis=1)
 
-            # Creates and labels each job
-            ax.broken_barh([(start_time, duration)], (machine - 0.4, 0.8), facecolors=colors(job))
-            ax.text(start_time + duration / 2, machine, f"J{job+1}", va='center', ha='center', color='white')
+    # Qualitative maps while they have a color per job, a continuous one after that
+    cmap = "tab10" if num_jobs <= 10 else "tab20" if num_jobs <= 20 else "turbo"
+    colors = plt.get_cmap(cmap, num_jobs)
+
+    fig, ax = plt.subplots(figsize=(10,6))
+    ax.add_collection(PolyCollection(verts, facecolors=colors(jobs), edgecolors="face"))
+    ax.autoscale_view()
+    if jobs.size <= label_limit:
+        for x, machine, job in zip((lefts + rights) / 2, machines, jobs):
+            ax.text(x, machine, f"J{job+1}", va='center', ha='center', color='white')
 
     # Set labels
     ax.set_xlabel("Time")
     ax.set_ylabel("Machines")
-    ax.set_yticks(range(num_machines))
-    ax.set_yticklabels([f"M{i+1}" for i in range(num_machines)])
-    plt.title(f"Open-Shop Schedule: {solution.makespan}" f" ({title})" if title else "")
+    ticks = np.arange(len(shown))[::max(1, len(shown) // 40)]
+    ax.set_yticks(ticks)
+    ax.set_yticklabels([f"M{shown[i]+1}" for i in ticks])
+    ax.set_title(f"Open-Shop Schedule: {solution.makespan}" f" ({title})" if title else "")
     if xlim:
-        plt.xlim(0, xlim)
+        ax.set_xlim(0, xlim)
     #ax.grid(True, axis='x', linestyle='--', alpha=0.7)
 
     # Display's first machine at the top
@@ -173,7 +916,7 @@ def plot_solution(solution: Solution, xlim : int = None, title : str = "", save_
 
     if save_path:
         path = f"./output/solution_plots/{save_path}.png"
-        plt.savefig(path, bbox_inches="tight")
-        plt.close()
+        fig.savefig(path, bbox_inches="tight")
+        plt.close(fig)
     else:
         plt.show()
@@ -0,0 +1,139 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from solution import Solution, DECODERS, lower_bound
+from woc import Woc
+from ga import ENGINES
+from instances import load_instance
+from shared import SharedArrays
+from workers import ga_process, ga_outputs, collect_ga_results, ga_cores
+'''
+Batch solver: GA + WOC on every instance file given, in one pass.
+
+    python solve.py data/ [more dirs or globs...] [--time-limit 10 | --evals 50000] [--num-ga 24] ... > results.jsonl
+
+Every GA of every instance goes into one queue on a single worker pool, biggest instances first, so the small ones
+fill in the gaps at the end instead of cores idling behind one big straggler. As soon as an instance's last GA finishes,
+its results are printed to stdout as one JSON line (progress goes to stderr).
+
+Budgets are per GA run. Runs also stop once any run of the same instance reaches the instance's lower bound.
+'''
+
+def instance_paths(sources: list[str]) -> list[str]:
+    """
+    Returns the instance files given by *sources*, each a directory (meaning every .txt file in it) or a glob.
+    Globs skip .npy files, like the caches older versions of instances.py kept next to the instances.
+    """
+    paths = []
+    for source in sources:
+        pattern = os.path.join(source, "*.txt") if os.path.isdir(source) else source
+        paths += [path for path in glob.glob(pattern) if not path.endswith(".npy")]
+    return sorted(set(paths))
+
+def instance_result(name: str, data: np.ndarray, outputs: SharedArrays, ga_results: list[dict], crowd: Woc, with_schedule: bool = False) -> dict:
+    """
+    Returns the JSON line of instance *name*, from its GAs' shared *outputs*, their leftover dicts *ga_results* and their WOC *crowd*.
+    Solution.data must hold the instance.
+    """
+    results = collect_ga_results(outputs, range(len(ga_results)), ga_results)
+    woc_sol = Solution(crowd.create_solution())
+    best_sol = min(results["best_sol"], woc_sol, key=lambda x: x.makespan)
+    bound = lower_bound(data)
+    line = {"instance" : name,
+            "shape" : list(data.shape),
+            "lower_bound" : float(bound),
+            "best_ms" : float(best_sol.makespan),
+            "gap" : float(best_sol.makespan / bound - 1),
+            "best_ga_ms" : float(results["best_ms"]),
+            "avg_ga_ms" : float(results["avg_ms"]),
+            "woc_ms" : float(woc_sol.makespan),
+            "avg_time" : float(results["avg_time"]),
+            "avg_generations" : float(results["avg_generations"]),
+            "avg_evaluations" : float(results["avg_evaluations"]),
+            "stop_reasons" : dict(results["stop_reasons"])}
+    if with_schedule:
+        line["schedule"] = best_sol.schedule.tolist()
+    return line
+
+def solve(args: argparse.Namespace) -> int:
+    paths = instance_paths(args.instances)
+    assert paths, f"No instance files in {args.instances}"
+
+    datas = {os.path.basename(path) : load_instance(path) for path in paths}
+    # Biggest first, so the queue ends on the small ones
+    names = sorted(datas, key=lambda name: (-datas[name].size, name))
+
+    generations = args.generations
+    if generations is None:
+        generations = 100 if args.time_limit is None and args.evals is None else 1000
+    ga_params = (args.pop_size, generations)
+    stop = {"stop_at_bound" : True, "time_limit" : args.time_limit, "max_evals" : args.evals}
+    options = {"engine" : args.engine, "stop" : stop, "decoder" : args.decoder}
+    Solution.decoder = args.decoder
+
+    shared = {}     # name -> (inputs, outputs) SharedArrays of an unfinished instance
+    done = {}       # name -> leftover dicts of its finished GAs
+    crowds = {}     # name -> streaming Woc of its finished GAs
+    start = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {}
+            for name in names:
+                data = datas[name]
+                inputs = SharedArrays.share(data=data)
+                outputs = SharedArrays(ga_outputs(args.num_ga, data.shape, generations))
+                shared[name] = (inputs, outputs)
+                specs = inputs.specs | outputs.specs
+                for i in range(args.num_ga):
+                    futures[executor.submit(ga_process, ga_params, specs, i, **options)] = (name, i)
+
+            num_solved = 0
+            for future in as_completed(futures):
+                name, slot = futures[future]
+                ga_results = done.setdefault(name, [])
+                ga_results.append(future.result())
+                outputs = shared[name][1]
+                crowd = crowds.setdefault(name, Woc.streaming(datas[name].shape))
+                crowd.add_expert(outputs["schedules"][slot], outputs["makespans"][slot])
+                if len(ga_results) < args.num_ga:
+                    continue
+
+                Solution.data = datas[name]
+                line = instance_result(name, datas[name], outputs, ga_results, crowd, args.schedules)
+                line["finished_after"] = time.time() - start
+                print(json.dumps(line), flush=True)
+
+                num_solved += 1
+                print(f"{name} done ({num_solved}/{len(names)} instances, {line["gap"]:.1%} over bound)", file=sys.stderr)
+                del done[name], crowds[name]
+                for group in shared.pop(name):
+                    group.close()
+    finally:
+        for groups in shared.values():
+            for group in groups:
+                group.close()
+
+    print(f"Solved {len(names)} instances in {time.time() - start:.1f}s", file=sys.stderr)
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Solve every given instance with GA + WOC, printing one JSON line per instance.")
+    parser.add_argument("instances", nargs="+", help="directories (every .txt file in them) or globs of instance files")
+    parser.add_argument("--time-limit", type=float, help="seconds per GA run")
+    parser.add_argument("--evals", type=int, help="decoded schedules per GA run")
+    parser.add_argument("--generations", type=int, help="most generations per GA run (default: 100, or 1000 with a budget)")
+    parser.add_argument("--num-ga", type=int, default=24, help="GA runs per instance, aggregated with WOC")
+    parser.add_argument("--pop-size", type=int, default=100)
+    parser.add_argument("--engine", default="list", choices=list(ENGINES))
+    parser.add_argument("--decoder", default="insertion", choices=list(DECODERS))
+    parser.add_argument("--workers", type=int, default=ga_cores())
+    parser.add_argument("--schedules", action="store_true", help="include each instance's best schedule")
+    return solve(parser.parse_args())
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import os
+import numpy as np
+import pytest
+
+import backend
+import ga
+import solution
+from instances import load_instance
+from solution import Solution, make_starts, make_starts_batch, make_makespan, dispatch, random_schedules
+from woc import Woc
+'''
+Checks every compiled kernel in backend.py against the pure Python/NumPy reference it replaces.
+Each case runs the same call twice, with backend.ENABLED off and on, and expects exactly the same result.
+'''
+
+pytestmark = pytest.mark.skipif(backend.NAME != "numba", reason="Numba backend not available")
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def both(monkeypatch, func):
+    """
+    Returns (reference result, compiled result) of calling *func*.
+    """
+    monkeypatch.setattr(backend, "ENABLED", False)
+    reference = func()
+    monkeypatch.setattr(backend, "ENABLED", True)
+    return reference, func()
+
+
+@pytest.fixture(params=["tai44_0.txt", "tai1010_0.txt", "tai2020_0.txt", "float"])
+def instance(request, monkeypatch):
+    np.random.seed(0)
+    if request.param == "float":
+        data = np.random.uniform(1, 99, (6, 9))
+    else:
+        data = load_instance(os.path.join(DATA_DIR, request.param))
+    monkeypatch.setattr(Solution, "data", data)
+    monkeypatch.setattr(Solution, "cache", None)
+    return data
+
+
+def mixed_schedules(shape, count=8):
+    """
+    Returns *count* proper schedules for *shape*, followed by as many with jobs repeated (and missing) within rows,
+    like aggregated schedules can have. Those give some jobs more intervals than there are machines.
+    """
+    repeated = np.random.randint(shape[1], size=(count,) + shape)
+    repeated[0] = 0     # Every operation on the same job
+    return np.concatenate((random_schedules(count, shape), repeated.astype(np.int64)))
+
+
+@pytest.fixture(params=["flat", "tree"])
+def intervals(request, monkeypatch):
+    # The kernels keep flat buffers at these sizes, so check them against both Python structures
+    if request.param == "tree":
+        monkeypatch.setattr(solution, "TREE_MIN_INTERVALS", 0)
+    return request.param
+
+
+def test_decode_starts(monkeypatch, instance, intervals):
+    num_jobs = instance.shape[1]
+    for schedule in mixed_schedules(instance.shape):
+        full, compiled = both(monkeypatch, lambda: make_starts(schedule))
+        np.testing.assert_array_equal(full, compiled)
+        assert full.dtype == compiled.dtype
+
+        from_col = np.random.randint(1, num_jobs)
+        ref, compiled = both(monkeypatch, lambda: make_starts(schedule, full, from_col))
+        np.testing.assert_array_equal(ref, compiled)
+        np.testing.assert_array_equal(ref, full)
+
+
+def test_decode_starts_batch(monkeypatch, instance):
+    schedules = mixed_schedules(instance.shape)
+    (ref_starts, ref_makespans), (starts, makespans) = both(monkeypatch, lambda: make_starts_batch(schedules))
+    np.testing.assert_array_equal(ref_starts, starts)
+    np.testing.assert_array_equal(ref_makespans, makespans)
+    for schedule, sched_starts in zip(schedules, starts):
+        np.testing.assert_array_equal(sched_starts, make_starts(schedule))
+
+
+def test_decode_makespan(monkeypatch, instance, intervals):
+    for schedule in mixed_schedules(instance.shape):
+        ref, compiled = both(monkeypatch, lambda: make_makespan(schedule))
+        assert ref == compiled
+        assert ref == Solution(schedule, make_starts(schedule)).makespan
+
+
+@pytest.mark.parametrize("active", [True, False])
+def test_dispatch(monkeypatch, instance, active):
+    for schedule in mixed_schedules(instance.shape):
+        ref, compiled = both(monkeypatch, lambda: dispatch(schedule, active))
+        np.testing.assert_array_equal(ref, compiled)
+        assert ref.dtype == compiled.dtype
+        ref, compiled = both(monkeypatch, lambda: dispatch(schedule, active, with_starts=False))
+        assert ref == compiled
+
+
+def test_fill_from_parent(monkeypatch):
+    np.random.seed(0)
+    for num_jobs in (1, 2, 5, 20):
+        for _ in range(50):
+            parent_row, donor_row = np.random.permutation(num_jobs), np.random.permutation(num_jobs)
+            start = np.random.randint(num_jobs)
+            end = np.random.randint(start, num_jobs + 1)
+
+            def fill():
+                child_row = np.full(num_jobs, -1)
+                child_row[start:end] = donor_row[start:end]
+                ga.fill_from_parent(child_row, parent_row, start, end)
+                return child_row
+            ref, compiled = both(monkeypatch, fill)
+            np.testing.assert_array_equal(ref, compiled)
+            assert sorted(compiled) == list(range(num_jobs))
+
+
+def test_agreement(monkeypatch, instance):
+    experts = mixed_schedules(instance.shape)
+
+    def agreement():
+        crowd = Woc(experts)
+        crowd.weights = np.random.RandomState(1).uniform(0, 1, len(experts))
+        crowd.find_agreement()
+        return crowd.A
+    ref, compiled = both(monkeypatch, agreement)
+    np.testing.assert_array_equal(ref, compiled)
+
+
+@pytest.mark.parametrize("shape", [(33, 33), (40, 60)])
+def test_decode_tree(monkeypatch, intervals, shape):
+    # The compiled treap only kicks in past backend.TREE_MIN_INTERVALS intervals of one job, which none of the instances get near
+    np.random.seed(0)
+    monkeypatch.setattr(Solution, "data", np.random.randint(1, 99, shape))
+    monkeypatch.setattr(Solution, "cache", None)
+    num_ops = shape[0] * shape[1]
+    assert num_ops > backend.TREE_MIN_INTERVALS
+
+    one_job = np.zeros(shape, dtype=np.int64)
+    # Mostly job 0, with other jobs' intervals landing in its gaps
+    mostly_one = np.where(np.random.rand(*shape) < 0.97, 0, np.random.randint(shape[1], size=shape))
+    for schedule in (one_job, mostly_one):
+        assert np.bincount(schedule.ravel()).max() > backend.TREE_MIN_INTERVALS
+        full, compiled = both(monkeypatch, lambda: make_starts(schedule))
+        np.testing.assert_array_equal(full, compiled)
+
+        from_col = np.random.randint(1, shape[1])
+        ref, compiled = both(monkeypatch, lambda: make_starts(schedule, full, from_col))
+        np.testing.assert_array_equal(ref, compiled)
+        np.testing.assert_array_equal(ref, full)
+
+        ref, compiled = both(monkeypatch, lambda: make_makespan(schedule))
+        assert ref == compiled
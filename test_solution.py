@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pytest
+
+import backend
+import ga
+from instances import load_instance
+from solution import Solution, make_starts, random_schedules
+'''
+Checks that incremental decoding (make_starts with prev_starts, Solution.changed and Solution.swap)
+gives exactly what decoding the whole schedule again does, on the bundled instances and with both backends.
+'''
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+INSTANCES = ["tai44_0.txt", "tai77_0.txt", "tai1515_0.txt", "tai2020_0.txt"]
+
+
+@pytest.fixture(params=["python", "numba"])
+def decoder_backend(request, monkeypatch):
+    # The backend is picked at import time, but make_starts checks backend.ENABLED on every call
+    if request.param == "numba" and backend.NAME != "numba":
+        pytest.skip("Numba backend not available")
+    monkeypatch.setattr(backend, "ENABLED", request.param == "numba")
+    return request.param
+
+
+@pytest.fixture(params=INSTANCES)
+def instance(request, monkeypatch):
+    monkeypatch.setattr(Solution, "data", load_instance(os.path.join(DATA_DIR, request.param)))
+    monkeypatch.setattr(Solution, "cache", None)
+    np.random.seed(0)
+    return Solution.data
+
+
+def rewrite_suffix(schedule: np.ndarray, from_col: int) -> np.ndarray:
+    """
+    Returns a copy of *schedule* with every machine's jobs from *from_col* onward shuffled among themselves.
+    """
+    new_schedule = schedule.copy()
+    for row in new_schedule:
+        row[from_col:] = np.random.permutation(row[from_col:])
+    return new_schedule
+
+
+def test_make_starts_suffix(decoder_backend, instance):
+    num_jobs = instance.shape[1]
+    for schedule in random_schedules(10, instance.shape):
+        prev_starts = make_starts(schedule)
+        for from_col in (0, 1, np.random.randint(num_jobs), num_jobs - 1, num_jobs):
+            new_schedule = rewrite_suffix(schedule, from_col)
+            np.testing.assert_array_equal(make_starts(new_schedule, prev_starts, from_col), make_starts(new_schedule))
+
+
+def test_changed(decoder_backend, instance):
+    num_jobs = instance.shape[1]
+    for schedule in random_schedules(10, instance.shape):
+        solution = Solution(schedule)
+        from_col = np.random.randint(num_jobs)
+        new_schedule = rewrite_suffix(solution.schedule, from_col)
+        changed = solution.changed(new_schedule, from_col)
+        np.testing.assert_array_equal(changed.starts, make_starts(new_schedule))
+        assert changed.makespan == Solution(new_schedule).makespan
+
+
+def test_swap(decoder_backend, instance):
+    num_machines, num_jobs = instance.shape
+    solution = Solution(random_schedules(1, instance.shape)[0])
+    for _ in range(30):
+        machine = np.random.randint(num_machines)
+        job1, job2 = np.random.randint(num_jobs, size=2)
+        swapped = solution.swap(machine, job1, job2)
+
+        expected = solution.schedule.copy()
+        expected[machine, [job1, job2]] = expected[machine, [job2, job1]]
+        np.testing.assert_array_equal(swapped.schedule, expected)
+        np.testing.assert_array_equal(swapped.starts, make_starts(expected))
+        assert swapped.makespan == Solution(expected).makespan
+        # Chain the swaps, so later ones start from incrementally decoded starts
+        solution = swapped
+
+
+def test_swap_lazy(decoder_backend, instance):
+    # Fresh solutions only have their makespan, so swapping one should decode the new schedule once, not the old one's starts first
+    solution = Solution(random_schedules(1, instance.shape)[0])
+    assert solution._starts is None
+    evaluations = Solution.evaluations
+    swapped = ga.mutate(solution, rate=1)
+    assert Solution.evaluations - evaluations == 1
+    assert solution._starts is None
+    assert swapped.makespan == Solution(swapped.schedule, make_starts(swapped.schedule)).makespan
@@ -0,0 +1,156 @@
+import os
+import sys
+import math
+import time
+import argparse
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from solution import Solution, lower_bound
+from woc import aggregate
+from ga import ENGINES
+from shared import SharedArrays
+from checkpoint import GACheckpoint
+from workers import ga_process, ga_outputs, ga_cores, collect_ga_results
+from main import create_data
+'''
+Successive-halving race of GA settings, instead of a full sweep per configuration.
+
+    python tune.py [--sizes 10,20] [--pop-sizes 50,100] [--cross-rates 0.6,0.75,0.9] [--mutate-rates 0.02,0.1] [--num-gas 8]
+                   [--min-gens 10] [--max-gens 160] [--eta 2] [--out ./output/tables/tune.csv]
+
+Every configuration (a combination of the listed values) starts on every size with --min-gens generations per GA run.
+After each rung, the best 1/eta of a size's configurations (by the mean makespan of their runs) race on with eta times the generations,
+their runs carrying on from where they stopped (see checkpoint.py), and the rest drop out. A size's race ends when one configuration
+is left or --max-gens is reached. Each rung's runs, over every size and configuration, go into one worker pool together.
+Rates are passed to each run, so a worker can run different configurations back to back.
+
+The result is a table per size, ranked by how far each configuration got and then by mean makespan, with its CPU cost.
+'''
+
+PARAMS = ("pop_size", "cross_rate", "mutate_rate", "num_ga")
+
+def configurations(args: argparse.Namespace) -> list[dict]:
+    """
+    Returns every combination of the listed parameter values.
+    """
+    grid = (args.pop_sizes, args.cross_rates, args.mutate_rates, args.num_gas)
+    return [dict(zip(PARAMS, values)) for values in itertools.product(*grid)]
+
+def run_rung(executor: ProcessPoolExecutor, datas: dict, configs: list[dict], racing: dict, generations: int, ckpt_dir: str,
+             engine: str = "list") -> dict:
+    """
+    Runs (or carries on) the GAs of every *racing* configuration of every size up to *generations*.
+
+    *datas* maps size -> instance, and *racing* size -> indices into *configs*.
+    Returns (size, config index) -> its row for the results table.
+    """
+    shared = {}     # size -> (inputs, outputs, {config index : slots})
+    futures = {}
+    try:
+        for size, data in datas.items():
+            slots = {}
+            for ind in racing[size]:
+                start = sum(len(s) for s in slots.values())
+                slots[ind] = range(start, start + configs[ind]["num_ga"])
+            inputs = SharedArrays.share(data=data)
+            outputs = SharedArrays(ga_outputs(sum(len(s) for s in slots.values()), data.shape, generations, groups=len(racing[size])))
+            shared[size] = (inputs, outputs, slots)
+            specs = inputs.specs | outputs.specs
+
+            # Configurations are siblings among their own runs only
+            for group, (ind, config_slots) in enumerate(slots.items()):
+                config = configs[ind]
+                for run, slot in enumerate(config_slots):
+                    checkpoint = GACheckpoint(os.path.join(ckpt_dir, f"{size}_{ind}_{run}.ga.npz"), every=sys.maxsize)
+                    future = executor.submit(ga_process, (config["pop_size"], generations), specs, slot, group, engine=engine,
+                                             stop={"stop_at_bound" : True}, checkpoint=checkpoint,
+                                             cross_rate=config["cross_rate"], mutate_rate=config["mutate_rate"])
+                    futures[future] = (size, ind)
+
+        ga_results = {}
+        for future in as_completed(futures):
+            ga_results.setdefault(futures[future], []).append(future.result())
+
+        rows = {}
+        for size, (_, outputs, slots) in shared.items():
+            Solution.data = datas[size]
+            bound = lower_bound(datas[size])
+            for ind, config_slots in slots.items():
+                results = collect_ga_results(outputs, config_slots, ga_results[(size, ind)])
+                woc_sol = aggregate(results["ga_solutions"])
+                rows[(size, ind)] = {"size" : size,
+                                     **configs[ind],
+                                     "generations" : generations,
+                                     "avg_ms" : results["avg_ms"],
+                                     "best_ms" : min(results["best_ms"], woc_sol.makespan),
+                                     "woc_ms" : woc_sol.makespan,
+                                     "gap (%)" : 100 * (min(results["best_ms"], woc_sol.makespan) / bound - 1),
+                                     "cpu_s" : results["avg_time"] * len(config_slots)}
+        return rows
+    finally:
+        for inputs, outputs, _ in shared.values():
+            inputs.close()
+            outputs.close()
+
+def race(args: argparse.Namespace) -> pd.DataFrame:
+    """
+    Races every configuration on every size (see module docstring) and returns the ranked table.
+    """
+    configs = configurations(args)
+    datas = {size : create_data(size, seed=69) for size in args.sizes}
+    racing = {size : list(range(len(configs))) for size in args.sizes}
+    rows = {}
+    generations = args.min_gens
+    start = time.time()
+
+    with tempfile.TemporaryDirectory() as ckpt_dir, ProcessPoolExecutor(max_workers=args.workers) as executor:
+        while True:
+            rows |= run_rung(executor, datas, configs, racing, generations, ckpt_dir, args.engine)
+            num_racing = sum(len(inds) for inds in racing.values())
+            print(f"{generations} generations: {num_racing} configurations raced ({time.time() - start:.1f}s in)")
+            if generations >= args.max_gens:
+                break
+
+            for size, inds in racing.items():
+                inds.sort(key=lambda ind: rows[(size, ind)]["avg_ms"])
+                del inds[max(1, math.ceil(len(inds) / args.eta)):]
+            if all(len(inds) == 1 for inds in racing.values()):
+                break
+            generations = min(generations * args.eta, args.max_gens)
+
+    df = pd.DataFrame(rows.values())
+    df = df.sort_values(["size", "generations", "avg_ms"], ascending=[True, False, True])
+    df.insert(1, "rank", df.groupby("size").cumcount() + 1)
+    return df.round(3)
+
+def main() -> int:
+    floats = lambda values: [float(value) for value in values.split(",")]
+    ints = lambda values: [int(value) for value in values.split(",")]
+    parser = argparse.ArgumentParser(description="Race GA settings with successive halving.")
+    parser.add_argument("--sizes", type=ints, default=[10, 20], help="comma-separated sizes of random instances (seeded like execute_66)")
+    parser.add_argument("--pop-sizes", type=ints, default=[50, 100])
+    parser.add_argument("--cross-rates", type=floats, default=[0.6, 0.75, 0.9])
+    parser.add_argument("--mutate-rates", type=floats, default=[0.02, 0.1])
+    parser.add_argument("--num-gas", type=ints, default=[8], help="GA runs per configuration (aggregated with WOC)")
+    parser.add_argument("--min-gens", type=int, default=10, help="generations in the first rung")
+    parser.add_argument("--max-gens", type=int, default=160)
+    parser.add_argument("--eta", type=int, default=2, help="1/eta of the configurations survive each rung, with eta times the generations")
+    parser.add_argument("--engine", default="list", choices=list(ENGINES))
+    parser.add_argument("--workers", type=int, default=ga_cores())
+    parser.add_argument("--out", default="./output/tables/tune.csv")
+    args = parser.parse_args()
+    assert args.eta >= 2, "Need eta >= 2 to ever drop anything."
+
+    df = race(args)
+    for size, table in df.groupby("size"):
+        print(f"\nSize {size}")
+        print(table.drop(columns="size").to_string(index=False))
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    df.to_csv(args.out, index=False)
+    print(f"\nWrote {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
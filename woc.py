@@ -1,6 +1,14 @@
+from __future__ import annotations
 import numpy as np
 from collections.abc import Iterable
-from solution import Solution
+from concurrent.futures import Executor
+from solution import Solution, decode_batch
+import backend
+
+# Crowds whose (M, N, N) agreement tensor would have more cells than this are large: their streaming tensor is float32,
+# and *aggregate* resolves them one machine at a time instead of building the tensor at all.
+# 2**19 cells is about 80 x 80, so 100 x 100 (8 MB of float64 tensor per crowd) and up are large.
+LARGE_CELLS = 2**19
 
 # a set of orders in which machines execute tasks. 
 # each numerical value is the job a task corresponds to. 
@@ -49,9 +57,23 @@ class Woc:
         '''
         self.experts = experts
 
-        self.P, self.M, self.N = np.array(experts).shape
+        self.P, self.M, self.N = np.shape(experts)
+
+        self.A = None       # Built by *find_agreement*
 
-        self.A = np.zeros([self.M, self.N, self.N])
+    @classmethod
+    def streaming(cls, shape: tuple[int, int]) -> Woc:
+        '''
+        Returns an empty crowd for (M, N) schedules, to be filled one expert at a time with *add_expert*.
+        Experts aren't kept around, only the agreement matrix (float32 for large crowds, see LARGE_CELLS).
+        '''
+        woc = cls.__new__(cls)
+        woc.experts = None
+        woc.P = 0
+        woc.M, woc.N = shape
+        dtype = np.float32 if woc.M * woc.N * woc.N > LARGE_CELLS else np.float64
+        woc.A = np.zeros([woc.M, woc.N, woc.N], dtype=dtype)
+        return woc
     
     def print_A(self):
         print(self.A)
@@ -59,39 +81,51 @@ class Woc:
     def find_agreement(self) -> None:
         '''
         agreement based on job_task sequence for each schedule from the population.
+
+        Done as one scatter-add: every (expert, machine, position) adds its expert's weight to A[machine][position][job].
         '''
-        for p in range(self.P):
-            for m in range(self.M):
-                for n in range(self.N):
-                    job_task = self.experts[p][m][n]
-                    self.A[m][n][job_task]+=self.weights[p]
+        experts = np.asarray(self.experts)
+        if self.A is None:
+            self.A = np.zeros([self.M, self.N, self.N])
+        if backend.ENABLED:
+            self.A += backend.agreement(experts, np.asarray(self.weights, dtype=float), self.A.shape)
+            return
+        weights = np.broadcast_to(np.asarray(self.weights, dtype=float)[:, None, None], experts.shape)
+        # Flat index of A[m][n][experts[p][m][n]]; bincount adds each bin's weights in expert order, same as the old loop
+        cells = np.arange(self.M * self.N).reshape(self.M, self.N) * self.N
+        flat = (cells + experts).ravel()
+        self.A += np.bincount(flat, weights=weights.ravel(), minlength=self.A.size).reshape(self.A.shape)
+
+    def add_expert(self, schedule: np.ndarray, weight: float) -> None:
+        '''
+        Streaming version of *find_agreement*: adds a single expert with the given *weight* to the agreement matrix.
+        '''
+        self.A[np.arange(self.M)[:, None], np.arange(self.N)[None, :], schedule] += weight
+        self.P += 1
 
     def create_solution(self) -> np.ndarray:
-        solution = np.full((self.M, self.N), -1)
-        flattened_ranks = np.argsort(self.A, axis=None)
-        # print(flattened_ranks)
-        machine, task, job_task = np.unravel_index(np.flip(flattened_ranks), self.A.shape)
-        # print(self.A.shape)
-        # print(self.A)
-        # print(f"{machine} \n{task} \n{job_task}")
-        for x in range(len(machine)):
-            if -1 not in solution:
-                break
-            m = machine[x]
-            n1 = task[x]
-            n2 = job_task[x]
-            # print(solution)
-            # print(f"m: {m} | n1: {n1} | n2: {n2}")
-            # input()
-            if solution[m][n1] == -1:
-                solution[m][n1] = n2
-
-        # for m in range(self.M):
-        #     for n in range(self.N):
-        #         for i in indices:
-        #             if not i in solution[m]:
-        #                 solution[m][n] = i
-        #                 break
+        '''
+        Every position of every machine gets the job with the most agreement there
+        (which is what walking the whole tensor from highest to lowest agreement ends up picking).
+        '''
+        return np.argmax(self.A, axis=2)
+
+    def create_solution_by_machine(self) -> np.ndarray:
+        '''
+        Same as *find_agreement* then *create_solution*, but each machine's (N, N) agreement is built and resolved on its own,
+        so the (M, N, N) tensor never exists. Like the streaming tensor of a large crowd, sums are float32, added in expert order,
+        so the result is the same as adding the experts one by one with *add_expert*.
+        '''
+        experts = np.asarray(self.experts)
+        weights = np.repeat(np.asarray(self.weights, dtype=np.float32), self.N)
+        cells = np.arange(self.N) * self.N
+        solution = np.empty((self.M, self.N), dtype=np.intp)
+        agreement = np.empty(self.N * self.N, dtype=np.float32)
+        for machine in range(self.M):
+            flat = (cells + experts[:, machine]).ravel()
+            agreement[:] = 0
+            np.add.at(agreement, flat, weights)
+            solution[machine] = np.argmax(agreement.reshape(self.N, self.N), axis=1)
         return solution
 
         
@@ -105,5 +139,120 @@ def aggregate(sols: Iterable[Solution]) -> Solution:
     woc.weights = [sol.makespan for sol in sols]
     total_weight = np.sum(woc.weights)
     for weight in woc.weights: weight/=total_weight
+    if woc.M * woc.N * woc.N > LARGE_CELLS:
+        return Solution(woc.create_solution_by_machine())
     woc.find_agreement()
     return Solution(woc.create_solution())
+
+
+# How much each expert counts in an ensemble variant, from the (P,) makespans of its experts.
+# "raw" is what *aggregate* does, "inverse" favors short makespans, "rank" gives the best expert P votes down to 1 for the worst.
+WEIGHTINGS = {"raw" : lambda makespans: makespans,
+              "inverse" : lambda makespans: 1 / makespans,
+              "rank" : lambda makespans: len(makespans) - np.argsort(np.argsort(makespans, kind="stable"), kind="stable")}
+
+def ensemble_variants(makespans: np.ndarray, top_ks: Iterable[int] = None, bootstraps: int = 8, weightings: Iterable[str] = tuple(WEIGHTINGS),
+                      seed: int = None) -> list[dict]:
+    """
+    Returns the variants an ensemble builds for experts with the given *makespans*: every expert subset under every weighting.
+
+    Subsets are all of them, the best k for every k in *top_ks* (default: a quarter and half of them),
+    and *bootstraps* random samples with replacement (drawn from *seed*). Each variant is a dict of
+    its "name", "subset" (subset name), "weighting" and "experts" (indices into the experts, repeats allowed).
+    """
+    num_experts = len(makespans)
+    if top_ks is None:
+        top_ks = sorted({max(2, num_experts // 4), max(2, num_experts // 2)} - {num_experts})
+    order = np.argsort(makespans, kind="stable")
+    rng = np.random.default_rng(seed)
+
+    subsets = {"all" : np.arange(num_experts)}
+    subsets |= {f"top{k}" : order[:k] for k in top_ks if k < num_experts}
+    subsets |= {f"bootstrap{b}" : rng.integers(num_experts, size=num_experts) for b in range(bootstraps)}
+    return [{"name" : f"{subset}/{weighting}", "subset" : subset, "weighting" : weighting, "experts" : experts}
+            for subset, experts in subsets.items() for weighting in weightings]
+
+def build_variants(experts: np.ndarray, makespans: np.ndarray, variants: list[dict]) -> np.ndarray:
+    """
+    Returns the (V, M, N) aggregate schedules of *variants* (see *ensemble_variants*) of the (P, M, N) *experts*.
+    Top-level, so it can go to a worker pool.
+    """
+    experts = np.asarray(experts)
+    makespans = np.asarray(makespans, dtype=float)
+    candidates = np.empty((len(variants), *experts.shape[1:]), dtype=experts.dtype)
+    for candidate, variant in zip(candidates, variants):
+        woc = Woc(experts[variant["experts"]])
+        woc.weights = WEIGHTINGS[variant["weighting"]](makespans[variant["experts"]])
+        if woc.M * woc.N * woc.N > LARGE_CELLS:
+            candidate[...] = woc.create_solution_by_machine()
+        else:
+            woc.find_agreement()
+            candidate[...] = woc.create_solution()
+    return candidates
+
+def repair(schedules: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns a copy of the (V, M, N) *schedules* with every row made a permutation of the jobs, and which schedules needed it.
+
+    Resolving agreement position by position can give a row the same job twice and leave others out, which the decoder
+    would quietly run short. A job keeps its first position in the row, and the positions of its repeats go to the missing jobs,
+    in increasing order.
+    """
+    schedules = np.array(schedules)
+    num_jobs = schedules.shape[-1]
+    rows = schedules.reshape(-1, num_jobs)
+    counts = np.zeros((len(rows), num_jobs), dtype=np.intp)
+    np.add.at(counts, (np.arange(len(rows))[:, None], rows), 1)
+    broken = np.flatnonzero((counts != 1).any(axis=1))
+    for ind in broken:
+        row = rows[ind]
+        _, first = np.unique(row, return_index=True)
+        repeats = np.ones(num_jobs, dtype=bool)
+        repeats[first] = False
+        row[repeats] = np.flatnonzero(counts[ind] == 0)
+    repaired = np.zeros(len(rows), dtype=bool)
+    repaired[broken] = True
+    return schedules, repaired.reshape(schedules.shape[:-2] + (-1,)).any(axis=-1)
+
+def evaluate_variants(candidates: np.ndarray, variants: list[dict], makespans: np.ndarray) -> tuple[Solution, list[dict]]:
+    """
+    Decodes the (V, M, N) *candidates* built for *variants* in one batch, and returns the best one
+    with a stats dict per variant: its "name", "subset", "weighting", "num_experts", "makespan",
+    "vs_best_expert" (relative to the best of the experts' *makespans*), "best" (1 for the returned one),
+    "beats_experts" (1 if it's shorter than every expert) and "repaired" (1 if it had to go through *repair* first).
+    Candidates are repaired before decoding, so every one that's compared runs every operation. Solution.data must hold the instance.
+    """
+    candidates, repaired = repair(candidates)
+    starts, candidate_ms = decode_batch(candidates)
+    best = int(np.argmin(candidate_ms))
+    best_expert = float(np.min(makespans))
+    stats = [{"name" : variant["name"],
+              "subset" : variant["subset"],
+              "weighting" : variant["weighting"],
+              "num_experts" : len(variant["experts"]),
+              "makespan" : float(ms),
+              "vs_best_expert" : float(ms) / best_expert - 1,
+              "best" : int(ind == best),
+              "beats_experts" : int(ms < best_expert),
+              "repaired" : int(repaired[ind])}
+             for ind, (variant, ms) in enumerate(zip(variants, candidate_ms))]
+    return Solution(candidates[best], starts[best]), stats
+
+def ensemble(sols: Iterable[Solution], executor: Executor = None, num_workers: int = None, **variant_args) -> tuple[Solution, list[dict]]:
+    """
+    Ensemble version of *aggregate*: builds the variants of *ensemble_variants* (given *variant_args*) of the crowd *sols*,
+    split over the *num_workers* workers of *executor* if given, and returns the best aggregate with per-variant stats (see *evaluate_variants*).
+    """
+    sols = list(sols)
+    experts = np.array([sol.schedule for sol in sols])
+    makespans = np.array([sol.makespan for sol in sols], dtype=float)
+    variants = ensemble_variants(makespans, **variant_args)
+    if executor is None:
+        candidates = build_variants(experts, makespans, variants)
+    else:
+        assert num_workers is not None, "Need the executor's number of workers to split the variants over."
+        chunks = np.array_split(np.arange(len(variants)), num_workers)
+        futures = [executor.submit(build_variants, experts, makespans, [variants[i] for i in chunk]) for chunk in chunks if len(chunk)]
+        candidates = np.concatenate([future.result() for future in futures])
+    return evaluate_variants(candidates, variants, makespans)
+
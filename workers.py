@@ -0,0 +1,177 @@
+import os
+from collections import Counter
+from collections.abc import Hashable
+import numpy as np
+from solution import Solution, FitnessCache
+from ga import ENGINES, Termination
+from shared import SharedArrays, attach, detach_others
+from instrument import Metrics, metrics
+from local_search import LocalSearch
+from checkpoint import GACheckpoint
+from progress import RunningStats, reporter
+'''
+The worker side of the experiments: the process function every GA runs in, and the shared arrays it reports through.
+
+Kept apart from main.py so that solvers (solve.py, service.py) can start workers without the plotting and table libraries.
+'''
+
+# Need this wrapper because processes have unique address spaces, so Solution.data doesn't hold.
+def ga_process(ga_params: tuple, specs: dict, index: int, group: int = 0, engine: str = "list", cache_size: int = 0, stop: dict = None,
+               instrument: bool = False, sample_interval: float = None, local_search: dict = None, decoder: str = "insertion",
+               checkpoint: GACheckpoint = None, keep_instances: int = 0, cross_rate: float = None, mutate_rate: float = None,
+               progress: Hashable = None) -> dict:
+    """
+    Process function that runs ga with given *ga_params*, using the GA implementation named *engine* (see ga.ENGINES).
+
+    *specs* describes the shared arrays made by *run_ga* (see shared.py). The instance is read from "data", and the run's
+    best schedule, its starts and makespan, the evolution curve and the time are written to slot *index* of the output arrays,
+    so only the small leftovers of the results dict (e.g. cache stats) are pickled back.
+
+    If *cache_size* is positive, the run gets its own FitnessCache of that size and reports its stats.
+
+    If *stop* is given, it holds keyword arguments for ga.Termination. Runs sharing a *group* are siblings:
+    once one of them reaches the lower bound it raises the group's "stop_flags" entry and the others stop too.
+
+    If *instrument* is set, the run's timers and counters are returned under "metrics" (see instrument.py),
+    with a sampling profile too if *sample_interval* is given.
+
+    If *local_search* is given, it holds keyword arguments for local_search.LocalSearch, which the (list) GA then applies to its elites.
+    *decoder* names the solution.DECODERS entry schedules are evaluated with.
+
+    If *checkpoint* is given, the GA saves its population there every few generations, and resumes from it if it's already there.
+
+    A worker stays attached to the last *keep_instances* instances it ran on besides this one (see shared.detach_others).
+
+    *cross_rate* and *mutate_rate* are this run's rates, Solution's if not given.
+
+    If *progress* is given, every generation's stats are sent under that key to the pool's progress.ProgressRelay as the run goes.
+    """
+    if instrument:
+        metrics.enable(sample_interval)
+
+    with metrics.phase("ipc"):
+        # Forked workers inherit the parent's numpy RNG state (seeded by create_data), so give each run its own
+        np.random.seed()
+
+        # Long-lived workers keep their views between tasks, so each instance is only attached once per worker
+        arrays = attach(specs)
+        Solution.data = arrays["data"]
+        Solution.cache = FitnessCache(cache_size) if cache_size > 0 else None
+        Solution.decoder = decoder
+        detach_others(specs, keep_instances)
+
+    termination = None
+    if stop is not None:
+        flags = arrays["stop_flags"]
+        termination = Termination(**stop, should_stop=lambda: flags[group] != 0)
+    extra = {}
+    if local_search is not None:
+        assert engine == "list", "Only the list GA has a local search stage."
+        extra["local_search"] = LocalSearch(**local_search)
+    if progress is not None:
+        extra["on_generation"] = reporter(progress)
+    results = ENGINES[engine](*ga_params, termination=termination, checkpoint=checkpoint, cross_rate=cross_rate, mutate_rate=mutate_rate, **extra)
+    if results["stop_reason"] == "lower_bound":
+        flags[group] = 1
+
+    with metrics.phase("ipc"):
+        leftovers = store_ga_result(arrays, index, results)
+    if instrument:
+        leftovers["metrics"] = metrics.snapshot()
+        metrics.disable()
+    return leftovers
+
+def store_ga_result(arrays: dict, index: int, results: dict) -> dict:
+    """
+    Writes a GA's *results* into slot *index* of the shared output *arrays* (see *ga_outputs*) and returns what's left of them.
+
+    Runs that stopped early have their evolution padded with their final makespan.
+    """
+    sol = results["best_solution"]
+    evolution = results["evolution"]
+    arrays["schedules"][index] = sol.schedule
+    arrays["starts"][index] = sol.starts
+    arrays["makespans"][index] = sol.makespan
+    arrays["evolution"][index, :len(evolution)] = evolution
+    arrays["evolution"][index, len(evolution):] = evolution[-1]
+    arrays["times"][index] = results["time"]
+    return {key : value for key, value in results.items() if key not in ("best_solution", "evolution", "time")}
+
+def ga_outputs(n: int, shape: tuple[int, int], generations: int, groups: int = 1) -> dict:
+    """
+    Returns the layout of the shared arrays *n* calls of *ga_process* write their results into, split into *groups* of siblings.
+    """
+    return {"schedules" : ((n, *shape), np.intp),
+            "starts" : ((n, *shape), np.float64),
+            "makespans" : ((n,), np.float64),
+            "evolution" : ((n, generations), np.float64),
+            "times" : ((n,), np.float64),
+            "stop_flags" : ((groups,), np.int8)}
+
+def ga_unit(n: int, shape: tuple[int, int], generations: int) -> dict:
+    """
+    Returns empty arrays for the final results of *n* GAs, laid out like *ga_outputs* minus the evolution curves,
+    which are only kept as running stats under "evolution_stats". *take_ga_result* fills them in one GA at a time.
+    """
+    return {"schedules" : np.empty((n, *shape), dtype=np.intp),
+            "starts" : np.empty((n, *shape)),
+            "makespans" : np.empty(n),
+            "times" : np.empty(n),
+            "evolution_stats" : RunningStats((generations,))}
+
+def take_ga_result(outputs: SharedArrays, slot: int, unit: dict, index: int) -> None:
+    """
+    Copies the GA results in *slot* of the shared *outputs* into row *index* of *unit* (see *ga_unit*), folding its evolution curve
+    into the unit's running stats, so the slot can be handed to the next GA.
+    """
+    for key in ("schedules", "starts", "makespans", "times"):
+        unit[key][index] = outputs[key][slot]
+    unit["evolution_stats"].add(outputs["evolution"][slot])
+
+def ga_cores() -> int:
+    """
+    Returns how many worker processes to run GAs on.
+    """
+    return max(1, (2 * os.cpu_count()) // 3)       # Dedicate 2/3 of logical processors to producing genetic results
+
+def collect_ga_results(outputs: SharedArrays | dict, slots: range, ga_results: list[dict], evolution_stats: RunningStats = None) -> dict:
+    """
+    Builds *run_ga*'s results dict from the given *slots* of the shared *outputs*, and the leftover dicts *ga_results* returned by *ga_process*.
+
+    Evolution curves and times are folded into running stats one run at a time, returned as "evolution_stats" and "time_stats"
+    besides their means ("avg_evolution", "avg_time") and standard deviations ("std_evolution", "std_time").
+    If the curves have been folded already, as *take_ga_result* does, pass their *evolution_stats*; *outputs* can then be a *ga_unit*.
+    Solution.data must hold the instance the GAs ran on.
+    """
+    ga_solutions = [Solution(np.copy(outputs["schedules"][i]), np.copy(outputs["starts"][i])) for i in slots]
+    best_sol = min(ga_solutions, key=lambda x: x.makespan)
+    time_stats = RunningStats()
+    for i in slots:
+        time_stats.add(outputs["times"][i])
+    if evolution_stats is None:
+        evolution_stats = RunningStats(outputs["evolution"].shape[1:])
+        for i in slots:
+            evolution_stats.add(outputs["evolution"][i])
+    results = {"ga_solutions" : ga_solutions,
+               "best_sol" : best_sol,
+               "best_ms" : best_sol.makespan,
+               "avg_ms" : np.mean([sol.makespan for sol in ga_solutions]),
+               "avg_evolution" : evolution_stats.mean,
+               "std_evolution" : evolution_stats.std,
+               "avg_time" : time_stats.mean,
+               "std_time" : time_stats.std,
+               "evolution_stats" : evolution_stats,
+               "time_stats" : time_stats}
+    if ga_results and "cache_stats" in ga_results[0]:
+        results["cache_stats"] = FitnessCache.merge_stats([result["cache_stats"] for result in ga_results])
+    if ga_results and "metrics" in ga_results[0]:
+        results["metrics"] = Metrics.merge([result["metrics"] for result in ga_results])
+    if ga_results:
+        results["stop_reasons"] = Counter(result["stop_reason"] for result in ga_results)
+        results["avg_generations"] = np.mean([result["generations"] for result in ga_results])
+        results["avg_evaluations"] = np.mean([result["evaluations"] for result in ga_results])
+    if ga_results and "evals_to_target" in ga_results[0]:
+        results["evals_to_target"] = [result["evals_to_target"] for result in ga_results]
+    if ga_results and "local_search" in ga_results[0]:
+        results["local_search"] = {stat : sum(result["local_search"][stat] for result in ga_results) for stat in ga_results[0]["local_search"]}
+    return results